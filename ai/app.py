@@ -2,6 +2,8 @@ import uvicorn
 from fastapi import FastAPI
 from loguru import logger
 from configs.config import AI_SERVER_URL
+from module.pipeline import warm_up_rag
+from module.utils import run_in_thread_pool
 from server.routers import router_list
 from urllib.parse import urlparse
 
@@ -18,6 +20,10 @@ async def startup_event():
         logger.info(f"Including router: {router}")
         app.include_router(router)
 
+    # Build the pipelines, LLMs and retrievers in parallel before serving queries
+    logger.info("Warming up the RAG components")
+    await run_in_thread_pool(warm_up_rag)
+
 
 if __name__ == "__main__":
     port = urlparse(AI_SERVER_URL).port
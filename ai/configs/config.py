@@ -15,6 +15,42 @@ UPLOAD_FOLDER = os.getenv(
 VECTOR_STORE_FOLDER = os.getenv(
     "VECTOR_STORE_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/vector_store")
 )
+# Tenant of the requests without one, its data keeps the single-tenant names and folders.
+# The components of the TENANT_CACHE_SIZE most recently used tenants are kept in memory
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", 8))
+# "chroma" for the Chroma server, "local" for the in-process store (no extra service on a single node)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+LOCAL_VECTOR_STORE_FOLDER = os.getenv(
+    "LOCAL_VECTOR_STORE_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/local_vector_store")
+)
+# "flat" for exact search, "hnsw" for an approximate index once the store has LOCAL_VECTOR_INDEX_MIN_SIZE chunks
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "flat")
+LOCAL_VECTOR_INDEX_MIN_SIZE = int(os.getenv("LOCAL_VECTOR_INDEX_MIN_SIZE", 50000))
+KEYWORD_INDEX_FOLDER = os.getenv(
+    "KEYWORD_INDEX_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/keyword_index")
+)
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(PROJECT_ROOT, "ai/data/embedding_cache/embeddings.db")
+)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+# Catalog of the ingested documents, used to list them without scanning the vector store
+DOCUMENT_CATALOG_PATH = os.getenv(
+    "DOCUMENT_CATALOG_PATH", os.path.join(PROJECT_ROOT, "ai/data/document_catalog/catalog.db")
+)
+# Batching of the embedding requests during ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+INGEST_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", 8000))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4))
+# Cache of the RAG answers, the similarity threshold is used for near-duplicate questions.
+# The semantic lookup is opt-in, similar questions may need different answers
+ANSWER_CACHE_FOLDER = os.getenv(
+    "ANSWER_CACHE_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/answer_cache")
+)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0.95))
 PDF_FOLDER = os.getenv("PDF_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/pdfs"))
 MARKDOWN_FOLDER = os.getenv(
     "MARKDOWN_FOLDER", os.path.join(PROJECT_ROOT, "ai/data/markdowns/text")
@@ -25,6 +61,65 @@ IMAGE_FOLDER = os.getenv(
 
 CONVERTER = os.getenv("CONVERTER", "llama_parse")
 
+# Number of processes converting page ranges of a PDF with MinerU, 1 to convert the whole file at once
+MINERU_PAGE_WORKERS = int(os.getenv("MINERU_PAGE_WORKERS", 1))
+MINERU_PAGES_PER_RANGE = int(os.getenv("MINERU_PAGES_PER_RANGE", 16))
+# Parsing mode of MinerU: "auto" classifies each PDF, "txt" or "ocr" force the mode. Only the
+# model of this mode ("txt" for "auto") is loaded on warm up
+MINERU_OCR_MODE = os.getenv("MINERU_OCR_MODE", "auto")
+
+INGEST_CHECKPOINT_PATH = os.getenv(
+    "INGEST_CHECKPOINT_PATH", os.path.join(PROJECT_ROOT, "ai/data/ingest_checkpoint.json")
+)
+
+# Number of chunks fetched by each retriever, and how they are fused into the context
+KEYWORD_RETRIEVER_K = int(os.getenv("KEYWORD_RETRIEVER_K", 5))
+SEMANTIC_RETRIEVER_K = int(os.getenv("SEMANTIC_RETRIEVER_K", 5))
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+CONTEXT_MAX_DOCUMENTS = int(os.getenv("CONTEXT_MAX_DOCUMENTS", 4))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 2000))
+
+# Optional reranking of the fused chunks ("none", "lexical", "cross_encoder" or "onnx") before the
+# context budgets are applied, the retrievers then fetch RERANK_CANDIDATES chunks each
+RERANKER = os.getenv("RERANKER", "none")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", 512))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+
+# Batch queries: maximum number of questions per request, and of LLM calls at the same time
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 1000))
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", 8))
+
+# Text segmentor ("markdown_header" or "token_bounded") and the size of the chunks of "token_bounded" in
+# tokens. Switching segmentor changes the chunks, so every document is embedded again on its next ingestion
+SEGMENTOR = os.getenv("SEGMENTOR", "markdown_header")
+SEGMENT_MAX_TOKENS = int(os.getenv("SEGMENT_MAX_TOKENS", 512))
+SEGMENT_MIN_TOKENS = int(os.getenv("SEGMENT_MIN_TOKENS", 64))
+SEGMENT_OVERLAP_TOKENS = int(os.getenv("SEGMENT_OVERLAP_TOKENS", 64))
+
+# Name of the RAG prompt on LangChain hub, the bundled copy of "rlm/rag-prompt" is used if empty
+RAG_PROMPT_HUB_NAME = os.getenv("RAG_PROMPT_HUB_NAME", "")
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "")
\ No newline at end of file
+OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "")
+
+# Maximum number of threads used to offload blocking work from the event loop
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", 64))
+
+# Timeout (seconds) and connection retries of the worker's calls to the backend
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+
+# Conversion queues, PDFs larger than CONVERT_LARGE_FILE_SIZE (bytes) go to the large queue
+# so they cannot hold up the small uploads
+CONVERT_QUEUE = os.getenv("CONVERT_QUEUE", "convert")
+CONVERT_LARGE_QUEUE = os.getenv("CONVERT_LARGE_QUEUE", "convert_large")
+CONVERT_LARGE_FILE_SIZE = int(os.getenv("CONVERT_LARGE_FILE_SIZE", 20 * 1024 * 1024))
+# Number of conversion workers started by the supervisor, 0 to size it from the CPU count,
+# capped per converter: LlamaParse jobs wait on the cloud API, MinerU jobs use the local CPU/GPU
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", 0))
+LLAMA_PARSE_MAX_WORKERS = int(os.getenv("LLAMA_PARSE_MAX_WORKERS", 8))
+MINERU_MAX_WORKERS = int(os.getenv("MINERU_MAX_WORKERS", 2))
+# Time (seconds) given to the workers to finish their current job on shutdown
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 600))
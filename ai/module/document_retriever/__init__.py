@@ -5,3 +5,7 @@ This file contains various implementation of document retriever
 from .builder import (DocumentRetrieverBuilder,
                       BM25RetrieverBuilder,
                       ChromaRetrieverBuilder)
+from .keyword_index import BM25KeywordIndex
+from .hybrid import DocumentFusion
+from .filters import normalize_filters
+from .reranker import Reranker
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
 
 from langchain.schema import Document
 from langchain.schema.runnable import RunnableLambda
-from langchain_community.retrievers import BM25Retriever
+from module.document_retriever.filters import MetadataFilters, split_query
+from module.document_retriever.keyword_index import BM25KeywordIndex
+from module.utils import run_in_thread_pool
 from module.vector_store import VectorStore
 
 
@@ -15,35 +18,86 @@ class DocumentRetrieverBuilder(ABC):
     def build(self):
         pass
 
+    @abstractmethod
+    async def abatch_retrieve(self, queries: List[str], filters: Optional[MetadataFilters] = None,
+                              embeddings: Optional[List] = None) -> List[List[Document]]:
+        """
+        Retrieve the chunks of many queries at once
+        :param queries: the query texts
+        :param filters: metadata filters shared by the queries
+        :param embeddings: the embeddings of the queries, if they are already computed
+        :return: the chunks of each query
+        """
+        pass
+
+
+def or_empty_document(documents: List[Document]) -> List[Document]:
+    """
+    Get the retrieved documents, or a single empty document when the store has nothing to return
+    """
+    return documents or [Document(page_content="", metadata={"source": "", "location": ""})]
+
 
 class BM25RetrieverBuilder(DocumentRetrieverBuilder):
-    def build(self):
-        documents = self.vector_store.get_vector_store_documents()
+    def __init__(self, k: int, vector_store: VectorStore, keyword_index: BM25KeywordIndex):
+        """
+        Create a builder for the BM25 keyword retriever
+        :param k: number of chunks to retrieve
+        :param vector_store: the vector store of the chunks
+        :param keyword_index: the incremental keyword index kept in sync with the vector store
+        """
+        super().__init__(k, vector_store)
+        self.keyword_index = keyword_index
 
-        if len(documents) == 0:
-            return RunnableLambda(lambda x: [Document(page_content="", metadata={"source": "", "location": ""})])
+    def build(self):
+        # The input is the query, or a dictionary with the query and its metadata filters
+        def retrieve(query: Union[str, Dict[str, Any]]) -> List[Document]:
+            query, filters = split_query(query)
+            return self.keyword_index.search(query, k=self.k, filters=filters)
 
-        metadatas = self.vector_store.get_vector_store_metadata()
+        # BM25 scoring is CPU-bound, so the async path runs it in the bounded thread pool
+        async def aretrieve(query: Union[str, Dict[str, Any]]) -> List[Document]:
+            return await run_in_thread_pool(retrieve, query)
 
-        documents = [
-            Document(
-                page_content=documents[index],
-                metadata={
-                    "source": metadata["source"],
-                    "location": metadata["location"],
-                },
-            )
-            for index, metadata in enumerate(metadatas)
-        ]
+        return RunnableLambda(retrieve, afunc=aretrieve)
 
-        # Initialize the retriever with Document objects
-        return BM25Retriever.from_documents(documents, k=self.k)
+    async def abatch_retrieve(self, queries: List[str], filters: Optional[MetadataFilters] = None,
+                              embeddings: Optional[List] = None) -> List[List[Document]]:
+        # The index is refreshed and filtered once, then every query is scored in the same thread pool call
+        return await run_in_thread_pool(self.keyword_index.search_many, queries, self.k, filters)
 
 
 class ChromaRetrieverBuilder(DocumentRetrieverBuilder):
     def build(self):
-        documents = self.vector_store.get_vector_store_documents()
+        # The store may be empty when the pipeline is built (e.g. a new tenant), so it is
+        # checked on every query and not once here
+        retriever = self.vector_store.as_retriever(search_kwargs={"k": self.k})
+
+        # The filters are pushed down into the store, so a scoped search only touches the matching chunks
+        def retrieve(query: Union[str, Dict[str, Any]]) -> List[Document]:
+            query, filters = split_query(query)
+            if filters is None:
+                return or_empty_document(retriever.invoke(query))
+            return or_empty_document(self.vector_store.similarity_search(query, k=self.k, filters=filters))
+
+        # The async path embeds the query and searches the store with native async calls
+        async def aretrieve(query: Union[str, Dict[str, Any]]) -> List[Document]:
+            query, filters = split_query(query)
+            return or_empty_document(await self.vector_store.asimilarity_search(query, k=self.k, filters=filters))
+
+        return RunnableLambda(retrieve, afunc=aretrieve)
+
+    async def aembed_queries(self, queries: List[str]) -> List:
+        """
+        Embed many queries in one batched call of the embedding model, as queries like a single search
+        :param queries: the query texts
+        :return: the embedding of each query
+        """
+        return await self.vector_store.embedding_function.aembed_queries(queries)
 
-        if len(documents) == 0:
-            return RunnableLambda(lambda x: [Document(page_content="", metadata={"source": "", "location": ""})])
-        return self.vector_store.as_retriever(search_kwargs={"k": self.k})
+    async def abatch_retrieve(self, queries: List[str], filters: Optional[MetadataFilters] = None,
+                              embeddings: Optional[List] = None) -> List[List[Document]]:
+        # Every query is searched in one call to the store
+        if embeddings is None:
+            embeddings = await self.aembed_queries(queries)
+        return await self.vector_store.asimilarity_search_by_vectors(embeddings, k=self.k, filters=filters)
@@ -0,0 +1,51 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements the metadata filters used to scope the retrieval to a subset of the chunks
+"""
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Filters on the chunk metadata, each key matches one of its values
+MetadataFilters = Dict[str, List[Any]]
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[MetadataFilters]:
+    """
+    Convert every filter value to a list of accepted values
+    :param filters: dictionary from metadata key to a value or a list of values
+    :return: the normalized filters, None if there is no filter
+    :raise ValueError: if a filter has an empty list of values
+    """
+    if not filters:
+        return None
+    normalized = {
+        key: list(value) if isinstance(value, (list, tuple, set)) else [value]
+        for key, value in filters.items()
+    }
+    # An empty list would match nothing, which is almost always a mistake of the caller
+    empty_keys = [key for key, values in normalized.items() if not values]
+    if empty_keys:
+        raise ValueError(f"Filters without any value: {', '.join(empty_keys)}")
+    return normalized
+
+
+def split_query(query: Union[str, Dict[str, Any]]) -> Tuple[str, Optional[MetadataFilters]]:
+    """
+    Get the query text and the filters from the input of a retriever
+    :param query: the query text, or a dictionary with the "query" and its "filters"
+    :return: the query text and the normalized filters
+    """
+    if isinstance(query, str):
+        return query, None
+    return query["query"], normalize_filters(query.get("filters"))
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Optional[MetadataFilters]) -> bool:
+    """
+    Check if the metadata of a chunk matches the filters
+    :param metadata: the metadata of the chunk
+    :param filters: the normalized filters
+    :return: True if every key matches one of its values
+    """
+    if not filters:
+        return True
+    return all(metadata.get(key) in values for key, values in filters.items())
@@ -0,0 +1,114 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements the fusion of the results of several retrievers into a single ranking
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+from module.utils import estimate_tokens, truncate_to_tokens
+
+
+def document_key(document: Document) -> Tuple[str, str]:
+    """
+    Get the key identifying the chunk of a document
+    :param document: the document
+    :return: (source, location) of the chunk
+    """
+    return str(document.metadata.get("source", "")), str(document.metadata.get("location", ""))
+
+
+def truncate_document(document: Document, max_tokens: int) -> Document:
+    """
+    Get a copy of the document cut to the token budget, with the same metadata
+    :param document: the document
+    :param max_tokens: maximum estimated number of tokens
+    :return: the cut document
+    """
+    return Document(page_content=truncate_to_tokens(document.page_content, max_tokens), metadata=document.metadata)
+
+
+class DocumentFusion:
+    def __init__(
+        self,
+        method: str = "rrf",
+        weights: Optional[Dict[str, float]] = None,
+        rrf_k: int = 60,
+        max_documents: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ):
+        """
+        Fuse the results of several retrievers, removing duplicated chunks
+        :param method: "rrf" for reciprocal rank fusion, "weighted" for weighted score fusion
+        :param weights: weight of each retriever, 1 by default
+        :param rrf_k: constant of the reciprocal rank fusion, higher values flatten the ranking
+        :param max_documents: maximum number of chunks to keep
+        :param max_tokens: maximum estimated number of tokens of the kept chunks
+        """
+        if method not in ("rrf", "weighted"):
+            raise ValueError(f"Fusion method {method} not found")
+        self.method = method
+        self.weights = weights or {}
+        self.rrf_k = rrf_k
+        self.max_documents = max_documents
+        self.max_tokens = max_tokens
+
+    def _score(self, rank: int, count: int) -> float:
+        """
+        Get the score of the chunk at a rank (starting from 0) among count chunks
+        """
+        if self.method == "rrf":
+            return 1 / (self.rrf_k + rank + 1)
+        # Weighted fusion of the rank-normalized scores, the best chunk has score 1
+        return 1 - rank / count
+
+    def fuse(self, results: Dict[str, List[Document]]) -> List[Document]:
+        """
+        Fuse the results of the retrievers into a single deduplicated ranking
+        :param results: dictionary from retriever name to its ranked documents
+        :return: the fused documents, cut to the document and token budgets
+        """
+        scores = defaultdict(float)
+        documents = {}
+        for name, retrieved in results.items():
+            retrieved = [document for document in retrieved if document.page_content]
+            weight = self.weights.get(name, 1.0)
+            for rank, document in enumerate(retrieved):
+                key = document_key(document)
+                scores[key] += weight * self._score(rank, len(retrieved))
+                documents.setdefault(key, document)
+
+        ranking = sorted(scores, key=scores.get, reverse=True)
+
+        # Keep the best chunks that fit in the budgets
+        fused, total_tokens = [], 0
+        for key in ranking:
+            if self.max_documents is not None and len(fused) >= self.max_documents:
+                break
+            tokens = estimate_tokens(documents[key].page_content)
+            if self.max_tokens is not None and total_tokens + tokens > self.max_tokens:
+                continue
+            fused.append(documents[key])
+            total_tokens += tokens
+
+        # The context is never empty, the best chunk is cut to the budget if it is too large on its own
+        if not fused and ranking and self.max_documents != 0:
+            fused.append(truncate_document(documents[ranking[0]], self.max_tokens))
+        return fused
+
+    def __call__(self, results: Dict[str, List[Document]]) -> List[Document]:
+        return self.fuse(results)
+
+
+def select_documents(results: Dict[str, List[Document]], selected: List[Document]) -> Dict[str, List[Document]]:
+    """
+    Only keep, for each retriever, the chunks that were selected by the fusion
+    :param results: dictionary from retriever name to its ranked documents
+    :param selected: the documents kept by the fusion
+    :return: dictionary from retriever name to its selected documents
+    """
+    selected_keys = {document_key(document) for document in selected}
+    return {
+        name: [document for document in retrieved if document_key(document) in selected_keys]
+        for name, retrieved in results.items()
+    }
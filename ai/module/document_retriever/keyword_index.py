@@ -0,0 +1,369 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements an incremental BM25 keyword index that is persisted to disk
+and shared between processes (AI server and convert workers)
+"""
+import fcntl
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set
+
+from langchain.schema import Document
+from module.vector_store import VectorStore
+
+from .filters import MetadataFilters, matches_filters
+
+
+def default_preprocessing_func(text: str) -> List[str]:
+    """
+    Split the text into tokens, the same way as LangChain BM25Retriever
+    :param text: the text to split
+    :return: list of tokens
+    """
+    return text.split()
+
+
+class BM25KeywordIndex:
+    def __init__(
+        self,
+        index_path: str,
+        vector_store: VectorStore,
+        k1: float = 1.5,
+        b: float = 0.75,
+        preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+    ):
+        """
+        Create a BM25 index that supports adding and removing single documents
+        :param index_path: the file where the index is persisted
+        :param vector_store: the store used to build the index when no persisted index exists
+        :param k1: BM25 term frequency saturation parameter
+        :param b: BM25 length normalization parameter
+        :param preprocess_func: function used to split text into tokens
+        """
+        self.index_path = index_path
+        self.lock_path = index_path + ".lock"
+        self.vector_store = vector_store
+        self.k1 = k1
+        self.b = b
+        self.preprocess_func = preprocess_func
+
+        # Lock for the threads of this process, the file lock is used between processes
+        self.thread_lock = threading.RLock()
+        self.loaded_version = None
+        self._reset()
+
+        # Writes waiting to be saved while the saves are deferred, see deferred_save
+        self.defer_depth = 0
+        self.pending_writes = []
+        self.max_pending = 0
+        self.max_delay = 0.0
+        self.on_flush = None
+        self.last_flush = time.time()
+
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with self._locked():
+            if os.path.exists(self.index_path):
+                self._load()
+            else:
+                self._build_from_vector_store()
+                self._save()
+
+    def _reset(self):
+        """
+        Clear the in-memory index
+        """
+        # chunk id -> (document, term frequencies, length)
+        self.chunks = {}
+        # document source -> chunk ids
+        self.documents = defaultdict(list)
+        # term -> {chunk id: term frequency}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the thread lock and the inter-process file lock
+        """
+        with self.thread_lock:
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _disk_version(self):
+        """
+        Get the version of the persisted index, None if it does not exist
+        """
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """
+        Load the index from disk
+        """
+        with open(self.index_path, "rb") as input_file:
+            state = pickle.load(input_file)
+        self._reset()
+        self.chunks = state["chunks"]
+        self.documents.update(state["documents"])
+        for chunk_id, (_, term_frequencies, _) in self.chunks.items():
+            for term, frequency in term_frequencies.items():
+                self.postings[term][chunk_id] = frequency
+        self.total_length = sum(length for _, _, length in self.chunks.values())
+        self.loaded_version = self._disk_version()
+
+    def _save(self):
+        """
+        Atomically persist the index to disk
+        """
+        state = {"chunks": self.chunks, "documents": dict(self.documents)}
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as output_file:
+            pickle.dump(state, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.index_path)
+        self.loaded_version = self._disk_version()
+
+    def _refresh(self):
+        """
+        Reload the index if another process has changed it
+        """
+        if self._disk_version() != self.loaded_version and os.path.exists(self.index_path):
+            self._load()
+
+    def _build_from_vector_store(self):
+        """
+        Build the index from all the chunks in the vector store
+        """
+        texts = self.vector_store.get_vector_store_documents()
+        if len(texts) == 0:
+            return
+        metadatas = self.vector_store.get_vector_store_metadata()
+        self._add_chunks(
+            [
+                Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(texts, metadatas)
+            ]
+        )
+
+    def _add_chunks(self, documents: List[Document]):
+        """
+        Add chunks to the in-memory index
+        """
+        for document in documents:
+            source = document.metadata["source"]
+            location = document.metadata["location"]
+            chunk_id = f"{source}_{location}"
+            if chunk_id in self.chunks:
+                self._remove_chunk(chunk_id)
+
+            term_frequencies = Counter(self.preprocess_func(document.page_content))
+            length = sum(term_frequencies.values())
+            # Keep the metadata the searches can be filtered on, the content hash is not needed
+            chunk = Document(
+                page_content=document.page_content,
+                metadata={key: value for key, value in document.metadata.items() if key != "content_hash"},
+            )
+            self.chunks[chunk_id] = (chunk, term_frequencies, length)
+            self.documents[source].append(chunk_id)
+            for term, frequency in term_frequencies.items():
+                self.postings[term][chunk_id] = frequency
+            self.total_length += length
+
+    def _remove_chunk(self, chunk_id: str):
+        """
+        Remove a single chunk from the in-memory index
+        """
+        chunk, term_frequencies, length = self.chunks.pop(chunk_id)
+        for term in term_frequencies:
+            self.postings[term].pop(chunk_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        source_chunks = self.documents.get(chunk.metadata["source"], [])
+        if chunk_id in source_chunks:
+            source_chunks.remove(chunk_id)
+        self.total_length -= length
+
+    def _replace_document(self, documents: List[Document]):
+        """
+        Replace the chunks of a document in the in-memory index
+        """
+        for source in {document.metadata["source"] for document in documents}:
+            for chunk_id in list(self.documents.pop(source, [])):
+                self._remove_chunk(chunk_id)
+        self._add_chunks(documents)
+
+    def _remove_document(self, document_name: str):
+        """
+        Remove the chunks of a document from the in-memory index
+        """
+        for chunk_id in list(self.documents.pop(document_name, [])):
+            self._remove_chunk(chunk_id)
+
+    def _write(self, operation: Callable, argument):
+        """
+        Apply a write to the index and persist it, or queue it while the saves are deferred
+        """
+        with self.thread_lock:
+            if self.defer_depth > 0:
+                self.pending_writes.append((operation, argument))
+                if (len(self.pending_writes) >= self.max_pending
+                        or time.time() - self.last_flush >= self.max_delay):
+                    self.flush()
+                return
+
+        with self._locked():
+            self._refresh()
+            operation(argument)
+            self._save()
+
+    def flush(self):
+        """
+        Apply the queued writes on top of the latest persisted index, and persist it once
+        """
+        with self._locked():
+            pending_writes, self.pending_writes = self.pending_writes, []
+            self.last_flush = time.time()
+            if pending_writes:
+                # The queued writes are replayed, so the writes of the other processes are kept
+                self._refresh()
+                for operation, argument in pending_writes:
+                    operation(argument)
+                self._save()
+        if self.on_flush is not None:
+            self.on_flush()
+
+    @contextmanager
+    def deferred_save(self, max_pending: int = 100, max_delay: float = 30.0,
+                      on_flush: Optional[Callable[[], None]] = None):
+        """
+        Queue the writes and persist them in batches, instead of pickling the whole index on every write,
+        e.g. while a folder is ingested. The queued writes are not searchable until they are saved
+        :param max_pending: number of queued writes that triggers a save
+        :param max_delay: time (seconds) since the last save after which the next write triggers a save
+        :param on_flush: called after each save of queued writes, e.g. to invalidate cached answers
+        """
+        with self.thread_lock:
+            if self.defer_depth == 0:
+                self.max_pending = max_pending
+                self.max_delay = max_delay
+                self.on_flush = on_flush
+                self.last_flush = time.time()
+            self.defer_depth += 1
+        try:
+            yield
+        finally:
+            with self.thread_lock:
+                self.defer_depth -= 1
+                if self.defer_depth == 0:
+                    self.flush()
+                    self.on_flush = None
+
+    def add_document(self, documents: List[Document]):
+        """
+        Add the chunks of a document to the index, replacing its previous chunks, and persist it
+        :param documents: the chunks of the document
+        """
+        self._write(self._replace_document, documents)
+
+    def remove_document(self, document_name: str):
+        """
+        Remove all the chunks of a document from the index and persist it
+        :param document_name: the source of the document
+        """
+        self._write(self._remove_document, document_name)
+
+    def _candidate_ids(self, filters: MetadataFilters) -> Set[str]:
+        """
+        Get the ids of the chunks matching the filters, using the chunks of each source when filtered by source
+        """
+        if "source" in filters:
+            candidate_ids = {
+                chunk_id for source in filters["source"] for chunk_id in self.documents.get(source, [])
+            }
+        else:
+            candidate_ids = set(self.chunks)
+        other_filters = {key: values for key, values in filters.items() if key != "source"}
+        if other_filters:
+            candidate_ids = {
+                chunk_id for chunk_id in candidate_ids
+                if matches_filters(self.chunks[chunk_id][0].metadata, other_filters)
+            }
+        return candidate_ids
+
+    def _score(self, query: str, k: int, candidate_ids: Optional[Set[str]], average_length: float) -> List[Document]:
+        """
+        Score the chunks for a query, must be called with the thread lock held
+        """
+        chunk_count = len(self.chunks)
+
+        # Only the chunks that contain at least one query term are scored
+        scores: Dict[str, float] = defaultdict(float)
+        for term in self.preprocess_func(query):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log((chunk_count - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+            if candidate_ids is not None:
+                # Walk the smaller of the postings and the candidates
+                if len(candidate_ids) < len(postings):
+                    postings = {
+                        chunk_id: postings[chunk_id] for chunk_id in candidate_ids if chunk_id in postings
+                    }
+                else:
+                    postings = {
+                        chunk_id: frequency for chunk_id, frequency in postings.items()
+                        if chunk_id in candidate_ids
+                    }
+            for chunk_id, frequency in postings.items():
+                length = self.chunks[chunk_id][2]
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                )
+
+        best_ids = heapq.nlargest(k, scores, key=scores.get)
+        return [self.chunks[chunk_id][0] for chunk_id in best_ids]
+
+    def search(self, query: str, k: int, filters: Optional[MetadataFilters] = None) -> List[Document]:
+        """
+        Get the k chunks with the highest BM25 score for the query
+        :param query: the query text
+        :param k: number of chunks to return
+        :param filters: only the chunks matching these metadata filters are scored
+        :return: list of matching chunks
+        """
+        return self.search_many([query], k, filters)[0]
+
+    def search_many(self, queries: List[str], k: int,
+                    filters: Optional[MetadataFilters] = None) -> List[List[Document]]:
+        """
+        Get the k chunks with the highest BM25 score for each query, the index is refreshed
+        and the chunks are filtered once for the whole batch
+        :param queries: the query texts
+        :param k: number of chunks to return per query
+        :param filters: only the chunks matching these metadata filters are scored
+        :return: list of matching chunks for each query
+        """
+        with self.thread_lock:
+            self._refresh()
+            chunk_count = len(self.chunks)
+            if chunk_count == 0:
+                return [[] for _ in queries]
+            average_length = self.total_length / chunk_count
+
+            # Pre-filter the chunks, so a scoped search only scores the matching subset
+            candidate_ids = self._candidate_ids(filters) if filters else None
+            if candidate_ids is not None and not candidate_ids:
+                return [[] for _ in queries]
+
+            return [self._score(query, k, candidate_ids, average_length) for query in queries]
@@ -0,0 +1,231 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements the rerankers that score the retrieved chunks against the question,
+to keep only the best ones in the context of the prompt
+"""
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from loguru import logger
+from module.utils import estimate_tokens
+
+from .hybrid import truncate_document
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+try:
+    import onnxruntime
+    from transformers import AutoTokenizer
+except ImportError:
+    onnxruntime = None
+    AutoTokenizer = None
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase words
+    """
+    return WORD_PATTERN.findall(text.lower())
+
+
+class Reranker(ABC):
+    def __init__(self, top_n: Optional[int] = None, max_tokens: Optional[int] = None):
+        """
+        Rerank the retrieved chunks and keep the best ones
+        :param top_n: maximum number of chunks to keep
+        :param max_tokens: maximum estimated number of tokens of the kept chunks
+        """
+        self.top_n = top_n
+        self.max_tokens = max_tokens
+
+    @abstractmethod
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """
+        Score the relevance of each document to the query, in a single batch
+        :param query: the question
+        :param documents: the candidate documents
+        :return: the score of each document, higher is more relevant
+        """
+        pass
+
+    def warm_up(self):
+        """
+        Load the model before the first query
+        """
+        self.score("warm up", [Document(page_content="warm up")])
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """
+        Sort the documents by relevance and keep the best ones that fit in the budgets
+        :param query: the question
+        :param documents: the candidate documents
+        :return: the kept documents, most relevant first
+        """
+        if not documents:
+            return []
+        scores = self.score(query, documents)
+        ranking = sorted(range(len(documents)), key=lambda index: scores[index], reverse=True)
+
+        kept, total_tokens = [], 0
+        for index in ranking:
+            if self.top_n is not None and len(kept) >= self.top_n:
+                break
+            tokens = estimate_tokens(documents[index].page_content)
+            if self.max_tokens is not None and total_tokens + tokens > self.max_tokens:
+                continue
+            kept.append(documents[index])
+            total_tokens += tokens
+
+        # The context is never empty, the best chunk is cut to the budget if it is too large on its own
+        if not kept and self.top_n != 0:
+            kept.append(truncate_document(documents[ranking[0]], self.max_tokens))
+        return kept
+
+    def __call__(self, query: str, documents: List[Document]) -> List[Document]:
+        return self.rerank(query, documents)
+
+    @staticmethod
+    def get_reranker(name: str, model: Optional[str] = None, max_length: int = 512,
+                     **kwargs) -> Optional["Reranker"]:
+        """
+        Get a reranker by name, falling back to the lexical reranker if its dependencies are missing
+        or its model cannot be loaded
+        :param name: "none", "lexical", "cross_encoder" or "onnx"
+        :param model: the model of the cross-encoder (name or folder) or the ONNX folder
+        :param max_length: maximum number of tokens of a (question, chunk) pair for the models
+        :param kwargs: the budgets of the reranker (top_n, max_tokens)
+        :return: the reranker, None if reranking is disabled
+        """
+        if name == "none":
+            return None
+        if name == "lexical":
+            return LexicalReranker(**kwargs)
+        if name == "cross_encoder":
+            if CrossEncoder is None:
+                logger.warning("sentence-transformers is not installed, falling back to the lexical reranker")
+                return LexicalReranker(**kwargs)
+            model_class = CrossEncoderReranker
+        elif name == "onnx":
+            if onnxruntime is None:
+                logger.warning("onnxruntime is not installed, falling back to the lexical reranker")
+                return LexicalReranker(**kwargs)
+            if not os.path.isfile(os.path.join(model or "", "model.onnx")):
+                logger.warning(f"{model} is not a folder with a model.onnx file, falling back to the lexical reranker")
+                return LexicalReranker(**kwargs)
+            model_class = ONNXReranker
+        else:
+            raise ValueError(f"Reranker {name} not found")
+
+        try:
+            return model_class(model, max_length=max_length, **kwargs)
+        except Exception as e:
+            logger.warning(f"Failed to load the reranker model {model} ({e}), falling back to the lexical reranker")
+            return LexicalReranker(**kwargs)
+
+
+class LexicalReranker(Reranker):
+    def __init__(self, k1: float = 1.2, b: float = 0.75, bigram_weight: float = 0.5, **kwargs):
+        """
+        Rerank with BM25 over the candidates, plus a bonus for the question bigrams found in the chunk.
+        Pure Python, used when no model is available
+        :param k1: term frequency saturation of BM25
+        :param b: length normalization of BM25
+        :param bigram_weight: weight of each matched bigram of the question
+        """
+        super().__init__(**kwargs)
+        self.k1 = k1
+        self.b = b
+        self.bigram_weight = bigram_weight
+
+    def warm_up(self):
+        pass
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        query_terms = tokenize(query)
+        query_bigrams = set(zip(query_terms, query_terms[1:]))
+        query_terms = set(query_terms)
+        document_terms = [tokenize(document.page_content) for document in documents]
+
+        # The document frequencies are computed over the candidates
+        document_frequency = Counter(term for terms in document_terms for term in set(terms) & query_terms)
+        average_length = sum(len(terms) for terms in document_terms) / len(documents) or 1.0
+        count = len(documents)
+
+        scores = []
+        for terms in document_terms:
+            frequency = Counter(terms)
+            normalization = self.k1 * (1 - self.b + self.b * len(terms) / average_length)
+            score = 0.0
+            for term in query_terms:
+                if term not in frequency:
+                    continue
+                idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency[term] * (self.k1 + 1) / (frequency[term] + normalization)
+            score += self.bigram_weight * len(query_bigrams & set(zip(terms, terms[1:])))
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    def __init__(self, model: str, max_length: int = 512, **kwargs):
+        """
+        Rerank with a cross-encoder (sentence-transformers) on the CPU
+        :param model: name or folder of the cross-encoder
+        :param max_length: maximum number of tokens of a (question, chunk) pair
+        """
+        super().__init__(**kwargs)
+        self.model = CrossEncoder(model, max_length=max_length, device="cpu")
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        # Every pair of the query is scored in one forward pass
+        pairs = [(query, document.page_content) for document in documents]
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False).tolist()
+
+
+class ONNXReranker(Reranker):
+    def __init__(self, model: str, max_length: int = 512, threads: int = 0, **kwargs):
+        """
+        Rerank with a cross-encoder exported to ONNX, run by onnxruntime on the CPU
+        :param model: folder with the model.onnx file and the tokenizer
+        :param max_length: maximum number of tokens of a (question, chunk) pair
+        :param threads: number of intra-op threads, 0 lets onnxruntime decide
+        """
+        super().__init__(**kwargs)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model, "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self.max_length = max_length
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        # Every pair of the query is tokenized and scored in one batch
+        inputs = self.tokenizer(
+            [query] * len(documents),
+            [document.page_content for document in documents],
+            padding=True,
+            truncation="only_second",
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        inputs = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        logits = self.session.run(None, inputs)[0]
+        if logits.ndim == 1:
+            return logits.tolist()
+        if logits.shape[1] == 2:
+            # Models with (not relevant, relevant) labels, ranked like the softmax of the relevant label
+            return (logits[:, 1] - logits[:, 0]).tolist()
+        return logits[:, 0].tolist()
@@ -4,4 +4,5 @@ This file contains various LLMs used in the RAG pipeline
 """
 
 from .builder import LargeLanguageModelBuilder
+from .prompt import RAG_PROMPT_TEMPLATE, get_rag_prompt
 
@@ -0,0 +1,24 @@
+from langchain_core.prompts import ChatPromptTemplate
+
+# Local copy of the "rlm/rag-prompt" prompt from LangChain hub, so no network fetch is needed
+RAG_PROMPT_TEMPLATE = (
+    "You are an assistant for question-answering tasks. "
+    "Use the following pieces of retrieved context to answer the question. "
+    "If you don't know the answer, just say that you don't know. "
+    "Use three sentences maximum and keep the answer concise.\n"
+    "Question: {question} \n"
+    "Context: {context} \n"
+    "Answer:"
+)
+
+
+def get_rag_prompt(hub_name: str = "") -> ChatPromptTemplate:
+    """
+    Get the prompt used for RAG
+    :param hub_name: name of a prompt on LangChain hub, the bundled prompt is used if empty
+    :return: the prompt template
+    """
+    if hub_name:
+        from langchain import hub
+        return hub.pull(hub_name)
+    return ChatPromptTemplate.from_messages([("human", RAG_PROMPT_TEMPLATE)])
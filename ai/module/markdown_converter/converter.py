@@ -5,7 +5,9 @@ This file defines the various converter used to convert PDF files to Markdown fi
 
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
 from fastapi import HTTPException
@@ -13,6 +15,9 @@ from llama_parse import LlamaParse
 from magic_pdf.data.data_reader_writer import FileBasedDataWriter
 from magic_pdf.pipe.UNIPipe import UNIPipe
 
+from configs.config import (MINERU_OCR_MODE, MINERU_PAGE_WORKERS,
+                            MINERU_PAGES_PER_RANGE)
+
 
 class MarkdownConverter(ABC):
     """
@@ -20,28 +25,157 @@ class MarkdownConverter(ABC):
     """
 
     @abstractmethod
-    def convert(self, input_path: str) -> str:
+    def convert(self, input_path: str, image_folder: Optional[str] = None) -> str:
         """
         Convert a file in file path to a markdown file
         :param input_path: location of the input file
+        :param image_folder: where to save the images, the folder of the converter if None
         :return: the markdown content (str)
         """
         return ""
 
+    def warm_up(self):
+        """
+        Load whatever the converter needs before the first file, so it is not paid per file
+        :return: None
+        """
+        pass
+
+
+def convert_pdf_pages(file_as_bytes: bytes, keys: dict, file_image_folder: str,
+                      start_page: int = 0, end_page: Optional[int] = None, ocr_mode: str = "auto") -> str:
+    """
+    Convert a range of pages of a PDF to markdown with MinerU
+    :param file_as_bytes: content of the PDF file
+    :param keys: the MinerU pipeline keys
+    :param file_image_folder: where to save the images of the pages
+    :param start_page: first page (starting from 0)
+    :param end_page: last page (included), None for the last page of the document
+    :param ocr_mode: "auto" to classify the PDF, "txt" or "ocr" to force the parsing mode
+    :return: the markdown content of the pages (str)
+    """
+    file_image_writer = FileBasedDataWriter(file_image_folder)
+
+    # Create a pipeline and extract the content
+    pipe = UNIPipe(file_as_bytes, dict(keys), image_writer=file_image_writer,
+                   start_page_id=start_page, end_page_id=end_page)
+    if ocr_mode == "auto":
+        pipe.pipe_classify()
+    else:
+        pipe.pdf_type = ocr_mode
+    pipe.pipe_analyze()
+    pipe.pipe_parse()
+    return pipe.pipe_mk_markdown(file_image_folder, drop_mode="image")
+
+
+def _convert_pdf_page_range(range_as_bytes: bytes, keys: dict, file_image_folder: str, ocr_mode: str) -> str:
+    """
+    Convert a range of pages of a PDF file in a worker process, the range is sent as a PDF of its own
+    """
+    return convert_pdf_pages(range_as_bytes, keys, file_image_folder, ocr_mode=ocr_mode)
+
+
+def _warm_up_worker(ocr_mode: str):
+    """
+    Load the MinerU model once per worker process
+    """
+    MinerUConverter.load_models(ocr_mode)
+
 
 class MinerUConverter(MarkdownConverter, ABC):
-    def __init__(self, image_folder: str):
+    def __init__(self, image_folder: str, page_workers: int = MINERU_PAGE_WORKERS,
+                 pages_per_range: int = MINERU_PAGES_PER_RANGE, ocr_mode: str = MINERU_OCR_MODE):
         """
         Define a MinerU text splitter, with image folder to save images in the document
         :param image_folder: where to save images in the documents
+        :param page_workers: number of processes converting page ranges of a large PDF at the same time
+        :param pages_per_range: number of pages converted by a process at a time
+        :param ocr_mode: "auto" to classify each PDF, "txt" or "ocr" to force the parsing mode
         """
+        if ocr_mode not in ("auto", "txt", "ocr"):
+            raise ValueError(f"MinerU mode {ocr_mode} not found")
         self.image_folder = image_folder
         self.keys = {"_pdf_type": "", "model_list": []}
+        self.page_workers = page_workers
+        self.pages_per_range = pages_per_range
+        self.ocr_mode = ocr_mode
+
+        # The page processes are created on first use and kept, so their models stay loaded
+        self.page_executor = None
+
+    def __getstate__(self):
+        # The process pool cannot be sent to another process
+        state = self.__dict__.copy()
+        state["page_executor"] = None
+        return state
 
-    def convert(self, input_path: str) -> str:
+    @staticmethod
+    def load_models(ocr_mode: str = "auto"):
+        """
+        Load the layout and OCR model of the parsing mode once, MagicPDF keeps it in a process-wide
+        singleton that is reused by every UNIPipe of the process. In "auto" mode the text model is
+        loaded, the OCR one is loaded by the first scanned PDF
+        :param ocr_mode: "auto", "txt" or "ocr"
+        :return: None
+        """
+        from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
+
+        # The singleton is keyed by the arguments, the defaults match the ones used by UNIPipe
+        ModelSingleton().get_model(ocr=ocr_mode == "ocr", show_log=False)
+
+    def warm_up(self):
+        """
+        Load the model in this process, and in the page processes when pages are converted in parallel
+        :return: None
+        """
+        if self.page_workers > 1:
+            # Submitting one task per worker starts all the processes, which load the model
+            executor = self._get_page_executor()
+            futures = [executor.submit(_warm_up_worker, self.ocr_mode) for _ in range(self.page_workers)]
+            for future in futures:
+                future.result()
+        else:
+            self.load_models(self.ocr_mode)
+
+    def _get_page_executor(self) -> ProcessPoolExecutor:
+        if self.page_executor is None:
+            self.page_executor = ProcessPoolExecutor(max_workers=self.page_workers,
+                                                     initializer=_warm_up_worker,
+                                                     initargs=(self.ocr_mode,))
+        return self.page_executor
+
+    def split_pages(self, input_path: str) -> List[bytes]:
+        """
+        Split a PDF into smaller PDFs of consecutive pages, so each page process only parses its own pages
+        :param input_path: input file path
+        :return: the content of the PDF of each page range, in page order
+        """
+        import fitz
+
+        ranges_as_bytes = []
+        with fitz.open(input_path) as pdf_document:
+            for start_page, end_page in self.get_page_ranges(pdf_document.page_count):
+                with fitz.open() as range_document:
+                    range_document.insert_pdf(pdf_document, from_page=start_page, to_page=end_page)
+                    ranges_as_bytes.append(range_document.tobytes())
+        return ranges_as_bytes
+
+    def get_page_ranges(self, page_count: int) -> List[Tuple[int, int]]:
+        """
+        Split the pages of a document into ranges
+        :param page_count: number of pages of the document
+        :return: list of (first page, last page included)
+        """
+        return [
+            (start, min(start + self.pages_per_range, page_count) - 1)
+            for start in range(0, page_count, self.pages_per_range)
+        ]
+
+    def convert(self, input_path: str, image_folder: Optional[str] = None) -> str:
         """
         Convert a single PDF file to markdown
         :param input_path: input file path
+        :param image_folder: where to save the images, the folder of the converter if None
         :return: the file content as Markdown (str)
         """
         # Extract all the components of the path
@@ -51,23 +185,30 @@ class MinerUConverter(MarkdownConverter, ABC):
         file_name = parts.parts[-1]
         file_name_without_extension = file_name.split(".")[0]
 
+        # Define the image folder to save image
+        file_image_folder = os.path.join(image_folder or self.image_folder, file_name_without_extension)
+
+        # Documents are split into page ranges converted in parallel. The images are named
+        # by the hash of their content, so the processes can share the image folder
+        if self.page_workers > 1:
+            ranges_as_bytes = self.split_pages(input_path)
+            executor = self._get_page_executor()
+            markdowns = executor.map(
+                _convert_pdf_page_range,
+                ranges_as_bytes,
+                [self.keys] * len(ranges_as_bytes),
+                [file_image_folder] * len(ranges_as_bytes),
+                [self.ocr_mode] * len(ranges_as_bytes),
+            )
+            # The results are in page order, so the markdown (and the chunks) are deterministic
+            return "\n\n".join(markdowns)
+
         # Read the file as bytes
         with open(input_path, "rb") as f:
             file_as_bytes = f.read()
 
-        # Define the image folder to save image
-        file_image_folder = os.path.join(self.image_folder, file_name_without_extension)
-        file_image_writer = FileBasedDataWriter(file_image_folder)
-
-        # Create a pipeline and extract the content
-        pipe = UNIPipe(file_as_bytes, self.keys, image_writer=file_image_writer)
-        pipe.pipe_classify()
-        pipe.pipe_analyze()
-        pipe.pipe_parse()
-        md_content = pipe.pipe_mk_markdown(file_image_folder, drop_mode="image")
-
         # Return the markdown content
-        return md_content
+        return convert_pdf_pages(file_as_bytes, self.keys, file_image_folder, ocr_mode=self.ocr_mode)
 
 
 class LlamaParseConverter(MarkdownConverter, ABC):
@@ -89,10 +230,11 @@ class LlamaParseConverter(MarkdownConverter, ABC):
         md = "\n".join(md)
         return md
 
-    def convert(self, input_path: str) -> str:
+    def convert(self, input_path: str, image_folder: Optional[str] = None) -> str:
         """
         Convert a single PDF file to markdown
         :param input_path: input file path
+        :param image_folder: where to save the images, the folder of the converter if None
         :return: the file content as Markdown (str)
         """
         # Extract all the components of the path
@@ -101,7 +243,7 @@ class LlamaParseConverter(MarkdownConverter, ABC):
         # Get the file name without extension
         file_name = parts.parts[-1]
         file_name_without_extension = file_name.split(".")[0]
-        file_image_folder = os.path.join(self.image_folder, file_name_without_extension)
+        file_image_folder = os.path.join(image_folder or self.image_folder, file_name_without_extension)
 
         try:
             json_obj = self.parser.get_json_result(input_path)[0]
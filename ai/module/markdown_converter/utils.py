@@ -4,15 +4,23 @@ This file contains the logic of converting PDFs file in a folder to Markdown fil
 """
 
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
 from module.markdown_converter.converter import MarkdownConverter
 
+# Converter of the current conversion process, sent once per process instead of once per file
+_process_converter = None
+
 
-def convert_file(input_path: str, output_path: str, file_converter: MarkdownConverter):
+def convert_file(input_path: str, output_path: str, file_converter: MarkdownConverter,
+                 image_folder: Optional[str] = None):
     """
     Convert a single PDF file to markdown and save it in output path
     :param input_path: input directory that contains PDF files
     :param output_path: output directory for the markdown files
     :param file_converter: markdown converter
+    :param image_folder: where to save the images, the folder of the converter if None
     :return: None
     """
     # Get the name of the file without extension (.pdf)
@@ -20,7 +28,7 @@ def convert_file(input_path: str, output_path: str, file_converter: MarkdownConv
     file_name_without_extension = pdf_file_name.split(".")[0]
 
     # Get the PDF content
-    file_content = file_converter.convert(input_path)
+    file_content = file_converter.convert(input_path, image_folder)
 
     # Save to output file
     markdown_file_path = os.path.join(output_path, f"{file_name_without_extension}.md")
@@ -28,20 +36,43 @@ def convert_file(input_path: str, output_path: str, file_converter: MarkdownConv
         output_file.write(file_content)
 
 
+def _init_converter(file_converter: MarkdownConverter):
+    """
+    Save the converter of a conversion process
+    """
+    global _process_converter
+    _process_converter = file_converter
+
+
+def _convert_file_in_process(input_path: str, output_path: str):
+    """
+    Convert a single PDF file with the converter of the conversion process
+    """
+    convert_file(input_path, output_path, _process_converter)
+
+
 def convert_folder(
-    input_path: str, output_path: str, file_converter: MarkdownConverter
+    input_path: str, output_path: str, file_converter: MarkdownConverter, max_workers: int = 1
 ):
     """
     Convert all PDFs file in the folder to markdown and save them in output path
     :param input_path: input directory that contains PDF files
     :param output_path: output directory for the markdown files
     :param file_converter: markdown converter
+    :param max_workers: number of processes converting files at the same time
     :return: None
     """
     # Get all the files from input path
     pdf_file_names = [file for file in os.listdir(input_path) if file.endswith(".pdf")]
+    file_paths = [os.path.join(input_path, pdf_file_name) for pdf_file_name in pdf_file_names]
 
     # Convert all pdf files
-    for pdf_file_name in pdf_file_names:
-        file_path = os.path.join(input_path, pdf_file_name)
-        convert_file(file_path, output_path, file_converter)
+    if max_workers <= 1:
+        for file_path in file_paths:
+            convert_file(file_path, output_path, file_converter)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_converter,
+                             initargs=(file_converter,)) as executor:
+        list(executor.map(_convert_file_in_process, file_paths, [output_path] * len(file_paths)))
@@ -3,57 +3,230 @@ Author: Trang Anh Thuan & Son Phat Tran
 This file contains the logic for the RAG pipeline
 """
 
-from langchain import hub
-from configs.config import VECTOR_STORE_URL
-from module.document_retriever import BM25RetrieverBuilder, ChromaRetrieverBuilder
-from module.llm import LargeLanguageModelBuilder
-from module.text_segmentor import MarkDownHeaderSegmentor
-from module.vector_store import ChromaClientVectorStore
+import os
+from functools import partial
+
+from configs.config import (ANSWER_CACHE_FOLDER, ANSWER_CACHE_SEMANTIC,
+                            ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                            ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL,
+                            CONTEXT_MAX_DOCUMENTS, CONTEXT_MAX_TOKENS,
+                            DEFAULT_TENANT, DOCUMENT_CATALOG_PATH,
+                            EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE,
+                            FUSION_METHOD, INGEST_BATCH_SIZE,
+                            INGEST_BATCH_TOKENS, INGEST_CONCURRENCY,
+                            KEYWORD_INDEX_FOLDER, KEYWORD_RETRIEVER_K,
+                            LOCAL_VECTOR_INDEX, LOCAL_VECTOR_INDEX_MIN_SIZE,
+                            LOCAL_VECTOR_STORE_FOLDER,
+                            RAG_PROMPT_HUB_NAME, RERANK_CANDIDATES,
+                            RERANKER, RERANKER_MAX_LENGTH, RERANKER_MODEL,
+                            SEGMENT_MAX_TOKENS,
+                            SEGMENT_MIN_TOKENS, SEGMENT_OVERLAP_TOKENS,
+                            SEGMENTOR, SEMANTIC_RETRIEVER_K,
+                            TENANT_CACHE_SIZE, VECTOR_STORE_BACKEND,
+                            VECTOR_STORE_URL)
+from module.document_retriever import (BM25KeywordIndex,
+                                       BM25RetrieverBuilder,
+                                       ChromaRetrieverBuilder,
+                                       DocumentFusion, Reranker)
+from module.llm import LargeLanguageModelBuilder, get_rag_prompt
+from module.text_segmentor import (MarkDownHeaderSegmentor,
+                                   TokenBoundedMarkdownSegmentor)
+from module.vector_store import ChromaClientVectorStore, LocalVectorStore
+from module.vector_store.batch_embedder import BatchEmbedder
+from module.vector_store.catalog import DocumentCatalog
+from module.vector_store.embedding_cache import EmbeddingCache
 from module.vector_store.embedding_functions import EmbeddingFunctionWrapper
 
+from .answer_cache import AnswerCache
 from .data_pipeline import DataPipeline
 from .rag_pipeline import RAGPipeline
+from .registry import (ComponentRegistry, LazyComponentMapping,
+                       LRUComponentCache)
+from .tenants import (get_collection_name, get_tenant_folder, get_tenant_path,
+                      validate_tenant_id)
+
+# Every component is registered here and only built on first use (or by warm_up),
+# so importing this module does no network work. The components shared by every
+# tenant (embeddings, prompt, LLMs) are in the registry, the data of each tenant
+# (store, indexes, caches and pipelines) is in its own registry
+registry = ComponentRegistry()
+
+
+def build_embedding_function():
+    # Create the Embeddings using your API key
+    # Remember to replace with your Google Gemini API Key
+    embedding = LargeLanguageModelBuilder.get_google_gemini_embedding()
+    return EmbeddingFunctionWrapper(embedding, cache=registry.get("embedding_cache"))
+
+
+def build_vector_store(tenant_id: str):
+    # Create a store for the text chunks of the tenant
+    batch_embedder = BatchEmbedder(
+        registry.get("embedding_function"),
+        max_batch_size=INGEST_BATCH_SIZE,
+        max_batch_tokens=INGEST_BATCH_TOKENS,
+        max_concurrency=INGEST_CONCURRENCY,
+    )
+    if VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStore(
+            get_tenant_folder(LOCAL_VECTOR_STORE_FOLDER, tenant_id),
+            registry.get("embedding_function"),
+            batch_embedder=batch_embedder,
+            index_type=LOCAL_VECTOR_INDEX,
+            index_min_size=LOCAL_VECTOR_INDEX_MIN_SIZE,
+        )
+    if VECTOR_STORE_BACKEND == "chroma":
+        return ChromaClientVectorStore(
+            VECTOR_STORE_URL,
+            registry.get("embedding_function"),
+            batch_embedder=batch_embedder,
+            collection_name=get_collection_name(tenant_id),
+        )
+    raise ValueError(f"Vector store {VECTOR_STORE_BACKEND} not found")
+
+
+def build_keyword_index(components: ComponentRegistry, tenant_id: str):
+    # Create the keyword index, kept in sync with the vector store by the data pipeline
+    return BM25KeywordIndex(
+        os.path.join(get_tenant_folder(KEYWORD_INDEX_FOLDER, tenant_id), "bm25_index.pkl"),
+        components.get("vector_store"),
+    )
+
+
+def build_document_catalog(components: ComponentRegistry, tenant_id: str):
+    # Create the catalog of the documents, filled once from the vector store if it is new
+    catalog = DocumentCatalog(get_tenant_path(DOCUMENT_CATALOG_PATH, tenant_id))
+    if catalog.is_empty():
+        catalog.rebuild(components.get("vector_store"))
+    return catalog
+
+
+def build_answer_cache(tenant_id: str):
+    # Create the cache of the answers, invalidated by the data pipeline
+    return AnswerCache(
+        os.path.join(get_tenant_folder(ANSWER_CACHE_FOLDER, tenant_id), "invalidated"),
+        embedding_function=registry.get("embedding_function") if ANSWER_CACHE_SEMANTIC else None,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl=ANSWER_CACHE_TTL,
+        max_size=ANSWER_CACHE_SIZE,
+    )
+
+
+def build_reranker():
+    # Create the reranker of the context, shared by every tenant
+    return Reranker.get_reranker(
+        RERANKER,
+        model=RERANKER_MODEL,
+        max_length=RERANKER_MAX_LENGTH,
+        top_n=CONTEXT_MAX_DOCUMENTS,
+        max_tokens=CONTEXT_MAX_TOKENS,
+    )
+
+
+def build_rag_pipeline(components: ComponentRegistry):
+    # Create BM25 keyword retriever and Chroma semantic retriever, both over-fetch
+    # and their results are fused into the context
+    reranker = registry.get("reranker")
+    keyword_k, semantic_k = KEYWORD_RETRIEVER_K, SEMANTIC_RETRIEVER_K
+    if reranker is not None:
+        # Fetch more candidates, the reranker keeps the best ones under the budgets
+        keyword_k, semantic_k = max(keyword_k, RERANK_CANDIDATES), max(semantic_k, RERANK_CANDIDATES)
+    keyword_builder = BM25RetrieverBuilder(
+        k=keyword_k,
+        vector_store=components.get("vector_store"),
+        keyword_index=components.get("keyword_index"),
+    )
+    semantic_builder = ChromaRetrieverBuilder(k=semantic_k, vector_store=components.get("vector_store"))
+    if reranker is None:
+        document_fusion = DocumentFusion(
+            method=FUSION_METHOD, max_documents=CONTEXT_MAX_DOCUMENTS, max_tokens=CONTEXT_MAX_TOKENS
+        )
+    else:
+        document_fusion = DocumentFusion(method=FUSION_METHOD, max_documents=RERANK_CANDIDATES)
+
+    # The LLMs are built when a model is first used
+    return RAGPipeline(
+        llm_model=LazyComponentMapping(registry, "llm:"),
+        prompt_template=registry.get("prompt"),
+        keyword_retriever_builder=keyword_builder,
+        semantic_retriever_builder=semantic_builder,
+        answer_cache=components.get("answer_cache"),
+        document_fusion=document_fusion,
+        reranker=reranker,
+    )
 
-# Create the LLMs and Embeddings using your API key
-# Remember to replace with your Google Gemini API Key
-embedding = LargeLanguageModelBuilder.get_google_gemini_embedding()
-embedding_function = EmbeddingFunctionWrapper(embedding)
-
-# Create the text segmentor
-# More will be created in the future
-segmentor = MarkDownHeaderSegmentor()
-
-# Create a store for text chunks
-# Replace with your appropriate folder
-# text_store = JsonVectorStore("data/vectors/json/data.json")
-vector_store = ChromaClientVectorStore(VECTOR_STORE_URL, embedding_function)
-
-# Create prompt template
-prompt = hub.pull("rlm/rag-prompt")
-
-# Create BM25 keyword retriever and Chroma semantic retriever
-keyword_builder = BM25RetrieverBuilder(k=1, vector_store=vector_store)
-semantic_builder = ChromaRetrieverBuilder(k=1, vector_store=vector_store)
-
-gemini_model = LargeLanguageModelBuilder.get_google_gemini_llm()
-openai_model = LargeLanguageModelBuilder.get_open_ai_llm()
-ollama_model = LargeLanguageModelBuilder.get_ollama_llm()
-
-llm_models = {
-    "gemini": gemini_model,
-    "openai": openai_model,
-    "ollama": ollama_model,
-}
-
-# Create RAG
-rag_pipeline = RAGPipeline(
-    llm_model=llm_models,
-    prompt_template=prompt,
-    keyword_retriever_builder=keyword_builder,
-    semantic_retriever_builder=semantic_builder,
+
+def build_segmentor():
+    # Create the text segmentor
+    if SEGMENTOR == "markdown_header":
+        return MarkDownHeaderSegmentor()
+    if SEGMENTOR == "token_bounded":
+        return TokenBoundedMarkdownSegmentor(
+            max_tokens=SEGMENT_MAX_TOKENS,
+            min_tokens=SEGMENT_MIN_TOKENS,
+            overlap_tokens=SEGMENT_OVERLAP_TOKENS,
+        )
+    raise ValueError(f"Segmentor {SEGMENTOR} not found")
+
+
+def build_data_pipeline(components: ComponentRegistry):
+    return DataPipeline(
+        embedding_model=registry.get("embedding_function"),
+        vector_store=components.get("vector_store"),
+        text_segmentor=build_segmentor(),
+        keyword_index=components.get("keyword_index"),
+        answer_cache=components.get("answer_cache"),
+        document_catalog=components.get("document_catalog"),
+    )
+
+
+def build_tenant_components(tenant_id: str) -> ComponentRegistry:
+    # Register the components of a tenant, built on first use like the shared ones
+    validate_tenant_id(tenant_id)
+    components = ComponentRegistry()
+    components.register("vector_store", partial(build_vector_store, tenant_id))
+    components.register("keyword_index", partial(build_keyword_index, components, tenant_id))
+    components.register("document_catalog", partial(build_document_catalog, components, tenant_id))
+    components.register("answer_cache", partial(build_answer_cache, tenant_id))
+    components.register("rag_pipeline", partial(build_rag_pipeline, components))
+    components.register("data_pipeline", partial(build_data_pipeline, components))
+    return components
+
+
+registry.register(
+    "embedding_cache",
+    lambda: EmbeddingCache(EMBEDDING_CACHE_PATH, max_memory_items=EMBEDDING_CACHE_SIZE),
 )
-data_pipeline = DataPipeline(
-    embedding_model=embedding_function,
-    vector_store=vector_store,
-    text_segmentor=segmentor,
-)
\ No newline at end of file
+registry.register("embedding_function", build_embedding_function)
+registry.register("prompt", lambda: get_rag_prompt(RAG_PROMPT_HUB_NAME))
+registry.register("reranker", build_reranker)
+registry.register("llm:gemini", LargeLanguageModelBuilder.get_google_gemini_llm)
+registry.register("llm:openai", LargeLanguageModelBuilder.get_open_ai_llm)
+registry.register("llm:ollama", LargeLanguageModelBuilder.get_ollama_llm)
+
+# The components of the most recently used tenants, the other ones are loaded again on use
+tenants = LRUComponentCache(build_tenant_components, max_size=TENANT_CACHE_SIZE, on_evict=ComponentRegistry.close)
+
+
+def get_rag_pipeline(tenant_id: str = DEFAULT_TENANT) -> RAGPipeline:
+    return tenants.get(tenant_id).get("rag_pipeline")
+
+
+def get_data_pipeline(tenant_id: str = DEFAULT_TENANT) -> DataPipeline:
+    return tenants.get(tenant_id).get("data_pipeline")
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return registry.get("embedding_cache")
+
+
+def warm_up_rag():
+    """
+    Build the components used to answer queries in parallel, for the default tenant
+    """
+    registry.warm_up(["embedding_function", "prompt", "reranker", *registry.names("llm:")])
+    reranker = registry.get("reranker")
+    if reranker is not None:
+        # Load the weights of the model before the first query
+        reranker.warm_up()
+    tenants.get(DEFAULT_TENANT).warm_up(["rag_pipeline", "data_pipeline"])
@@ -0,0 +1,236 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements a cache of RAG answers with optional semantic lookup of similar questions
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize the question so trivially different questions share the same key
+    :param question: the question of the user
+    :return: the normalized question
+    """
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        invalidation_path: str,
+        embedding_function: Any = None,
+        similarity_threshold: float = 0.95,
+        ttl: float = 3600,
+        max_size: int = 1000,
+    ):
+        """
+        Create a cache of RAG answers keyed by (model name, normalized question)
+        :param invalidation_path: marker file touched on invalidation, shared between processes
+        :param embedding_function: optional embedding function used to find similar questions
+        :param similarity_threshold: minimum cosine similarity for a semantic hit
+        :param ttl: time (seconds) before an answer expires
+        :param max_size: maximum number of cached answers
+        """
+        self.invalidation_path = invalidation_path
+        self.embedding_function = embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # (model name, normalized question) -> (answer, normalized embedding, creation time)
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[Any, Optional[np.ndarray], float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters for the cache metrics
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(self.invalidation_path), exist_ok=True)
+        self.seen_version = self._invalidation_version()
+
+    def _invalidation_version(self):
+        """
+        Get the version of the invalidation marker, None if it does not exist
+        """
+        try:
+            return os.stat(self.invalidation_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _check_invalidation(self):
+        """
+        Clear the cache if it has been invalidated, possibly by another process
+        """
+        version = self._invalidation_version()
+        if version != self.seen_version:
+            self.entries.clear()
+            self.seen_version = version
+
+    def version(self):
+        """
+        Get the invalidation version, to be read before answering a question and passed to put
+        so an answer computed before an invalidation is not cached
+        :return: the version of the invalidation marker
+        """
+        return self._invalidation_version()
+
+    def invalidate(self):
+        """
+        Clear the cache in this process and in every other process sharing the marker file
+        """
+        with self.lock:
+            with open(self.invalidation_path, "a"):
+                os.utime(self.invalidation_path, None)
+            self.entries.clear()
+            self.seen_version = self._invalidation_version()
+
+    @staticmethod
+    def _normalize_embedding(embedding) -> Optional[np.ndarray]:
+        """
+        Convert the embedding to a unit-length vector so the dot product is the cosine similarity
+        """
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _get_exact(self, key: Tuple[str, str]) -> Optional[Any]:
+        """
+        Get the answer cached under exactly this key, after dropping the expired answers
+        """
+        self._check_invalidation()
+
+        # Drop the expired answers, the oldest ones are first
+        now = time.time()
+        while self.entries:
+            oldest_key = next(iter(self.entries))
+            if now - self.entries[oldest_key][2] <= self.ttl:
+                break
+            self.entries.pop(oldest_key)
+
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def _get_similar(self, model_name: str, embedding) -> Optional[Any]:
+        """
+        Get the answer of the most similar cached question of the same model, if similar enough
+        """
+        query_vector = self._normalize_embedding(embedding)
+        candidates = [
+            (answer, vector)
+            for (name, _), (answer, vector, _) in self.entries.items()
+            if name == model_name and vector is not None and vector.shape == query_vector.shape
+        ]
+        if not candidates:
+            return None
+        similarities = np.stack([vector for _, vector in candidates]) @ query_vector
+        best = int(np.argmax(similarities))
+        return candidates[best][0] if similarities[best] >= self.similarity_threshold else None
+
+    def _lookup_exact(self, question: str, model_name: str) -> Optional[Any]:
+        """
+        Exact lookup, counting the hit
+        """
+        with self.lock:
+            answer = self._get_exact((model_name, normalize_question(question)))
+            if answer is not None:
+                self.exact_hits += 1
+            elif self.embedding_function is None:
+                self.misses += 1
+            return answer
+
+    def _lookup_similar(self, model_name: str, embedding) -> Optional[Any]:
+        """
+        Semantic lookup, counting the hit or the miss
+        """
+        with self.lock:
+            answer = self._get_similar(model_name, embedding)
+            if answer is not None:
+                self.semantic_hits += 1
+            else:
+                self.misses += 1
+            return answer
+
+    def lookup(self, question: str, model_name: str) -> Tuple[Optional[Any], Any]:
+        """
+        Get the cached answer of the question, or of a similar enough question
+        :param question: the question of the user
+        :param model_name: name of the LLM
+        :return: the cached answer (None if there is no hit) and the embedding of the question
+        (None if it was not needed), to be passed to put
+        """
+        answer = self._lookup_exact(question, model_name)
+        if answer is not None or self.embedding_function is None:
+            return answer, None
+        embedding = self.embedding_function.embed_query(question)
+        return self._lookup_similar(model_name, embedding), embedding
+
+    async def alookup(self, question: str, model_name: str) -> Tuple[Optional[Any], Any]:
+        """
+        Asynchronously get the cached answer of the question, or of a similar enough question
+        :param question: the question of the user
+        :param model_name: name of the LLM
+        :return: the cached answer (None if there is no hit) and the embedding of the question
+        (None if it was not needed), to be passed to put
+        """
+        answer = self._lookup_exact(question, model_name)
+        if answer is not None or self.embedding_function is None:
+            return answer, None
+        embedding = await self.embedding_function.aembed_query(question)
+        return self._lookup_similar(model_name, embedding), embedding
+
+    def lookup_with_embedding(self, question: str, model_name: str, embedding) -> Optional[Any]:
+        """
+        Get the cached answer of the question, or of a similar enough question,
+        when the embedding of the question has already been computed
+        :param question: the question of the user
+        :param model_name: name of the LLM
+        :param embedding: embedding of the question
+        :return: the cached answer, None if there is no hit
+        """
+        answer = self._lookup_exact(question, model_name)
+        if answer is not None or self.embedding_function is None:
+            return answer
+        return self._lookup_similar(model_name, embedding)
+
+    def put(self, question: str, model_name: str, answer: Any, version, embedding=None):
+        """
+        Save the answer of the question, unless the cache has been invalidated since it was computed
+        :param question: the question of the user
+        :param model_name: name of the LLM
+        :param answer: the answer to cache
+        :param version: the invalidation version read before the lookup of the question
+        :param embedding: embedding of the question, used for the semantic lookup
+        """
+        key = (model_name, normalize_question(question))
+        with self.lock:
+            self._check_invalidation()
+            # The answer may come from the documents before the invalidation
+            if self.seen_version != version:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (answer, self._normalize_embedding(embedding), time.time())
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the hit and miss counters of the cache
+        :return: dictionary of the metrics
+        """
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,162 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file contains the logic of converting and ingesting a whole folder of PDFs in parallel,
+with a checkpoint so an interrupted run can be resumed
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from typing import Dict, List
+
+from loguru import logger
+from module.markdown_converter import Converter
+from module.markdown_converter.utils import convert_file
+
+from .data_pipeline import DataPipeline
+
+# Converter of the current conversion process, created once per process
+_process_converter = None
+
+
+def _init_converter(converter_name: str, image_folder: str):
+    """
+    Create the converter of a conversion process
+    """
+    global _process_converter
+    _process_converter = Converter.get_converter(converter_name)(image_folder)
+
+
+def _convert_pdf(pdf_path: str, markdown_folder: str) -> str:
+    """
+    Convert a PDF in a conversion process
+    :return: the path of the markdown file
+    """
+    convert_file(pdf_path, markdown_folder, _process_converter)
+    file_name_without_extension = os.path.basename(pdf_path).split(".")[0]
+    return os.path.join(markdown_folder, f"{file_name_without_extension}.md")
+
+
+class IngestCheckpoint:
+    def __init__(self, path: str):
+        """
+        Record which files have been converted and ingested
+        :param path: the JSON file of the checkpoint
+        """
+        self.path = path
+        self.state: Dict[str, List[str]] = {"converted": [], "ingested": []}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as input_file:
+                self.state.update(json.load(input_file))
+        self.converted = set(self.state["converted"])
+        self.ingested = set(self.state["ingested"])
+
+    def mark(self, stage: str, name: str):
+        """
+        Record that a file has passed a stage and atomically save the checkpoint
+        :param stage: "converted" or "ingested"
+        :param name: the name of the PDF file
+        """
+        getattr(self, stage).add(name)
+        self.state[stage] = sorted(getattr(self, stage))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as output_file:
+            json.dump(self.state, output_file, indent=2)
+        os.replace(temp_path, self.path)
+
+
+def bulk_ingest(
+    pdf_folder: str,
+    markdown_folder: str,
+    image_folder: str,
+    converter_name: str,
+    data_pipeline: DataPipeline,
+    checkpoint_path: str,
+    convert_workers: int = 2,
+    ingest_workers: int = 4,
+) -> Dict[str, float]:
+    """
+    Convert the PDFs of a folder in a process pool and ingest the markdown files in a thread pool.
+    Files already recorded in the checkpoint are skipped
+    :param pdf_folder: folder of the PDF files
+    :param markdown_folder: output folder of the markdown files
+    :param image_folder: output folder of the images
+    :param converter_name: name of the PDF converter
+    :param data_pipeline: the pipeline used to ingest the markdown files
+    :param checkpoint_path: the JSON file recording the progress
+    :param convert_workers: number of conversion processes
+    :param ingest_workers: number of ingestion threads
+    :return: the statistics of the run
+    """
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    pdf_names = sorted(name for name in os.listdir(pdf_folder) if name.endswith(".pdf"))
+    pending = [name for name in pdf_names if name not in checkpoint.ingested]
+    logger.info(f"{len(pdf_names) - len(pending)} of {len(pdf_names)} PDFs already processed")
+
+    start_time = time.time()
+    converted_count, ingested_count, failed = 0, 0, []
+
+    # The ingested files are only recorded once the keyword index with their chunks is saved,
+    # the saves can happen in the ingestion threads
+    checkpoint_lock = threading.Lock()
+    unsaved_names = []
+
+    def record_ingested():
+        with checkpoint_lock:
+            for unsaved_name in unsaved_names:
+                checkpoint.mark("ingested", unsaved_name)
+            unsaved_names.clear()
+
+    # The keyword index is saved in batches instead of once per ingested file
+    with data_pipeline.deferred_index_save(on_flush=record_ingested), \
+            ProcessPoolExecutor(max_workers=convert_workers,
+                                initializer=_init_converter,
+                                initargs=(converter_name, image_folder)) as convert_executor, \
+            ThreadPoolExecutor(max_workers=ingest_workers) as ingest_executor:
+        futures = {}
+        for name in pending:
+            markdown_path = os.path.join(markdown_folder, f"{name.split('.')[0]}.md")
+            if name in checkpoint.converted and os.path.exists(markdown_path):
+                futures[ingest_executor.submit(data_pipeline.add_single_document, markdown_path)] = ("ingest", name)
+            else:
+                futures[convert_executor.submit(_convert_pdf, os.path.join(pdf_folder, name), markdown_folder)] = (
+                    "convert", name)
+
+        # Each converted file is ingested as soon as it is ready
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, name = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to {stage} {name}: {e}")
+                    failed.append(name)
+                    continue
+
+                if stage == "convert":
+                    with checkpoint_lock:
+                        checkpoint.mark("converted", name)
+                    converted_count += 1
+                    futures[ingest_executor.submit(data_pipeline.add_single_document, result)] = ("ingest", name)
+                else:
+                    with checkpoint_lock:
+                        unsaved_names.append(name)
+                    ingested_count += 1
+                    elapsed = time.time() - start_time
+                    logger.info(f"[{ingested_count}/{len(pending)}] Ingested {name} "
+                                f"({ingested_count / elapsed:.2f} files/s)")
+
+    elapsed = time.time() - start_time
+    stats = {
+        "converted": converted_count,
+        "ingested": ingested_count,
+        "failed": len(failed),
+        "seconds": elapsed,
+        "files_per_second": ingested_count / elapsed if elapsed > 0 else 0.0,
+    }
+    logger.info(f"Bulk ingestion finished: {stats}")
+    return stats
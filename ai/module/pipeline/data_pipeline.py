@@ -1,9 +1,17 @@
-from typing import Any, List
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
 
+from module.document_retriever import BM25KeywordIndex
 from module.text_segmentor import TextSegmentor
 from module.vector_store import VectorStore
+from module.vector_store.catalog import DocumentCatalog
 from module.vector_store.folder import (add_vectors_single_document,
-                                        remove_vectors_single_document)
+                                        get_content_hash, is_valid_document,
+                                        remove_vectors_single_document,
+                                        update_vectors_single_document)
+
+from .answer_cache import AnswerCache
 
 class DataPipeline:
     def __init__(
@@ -11,6 +19,9 @@ class DataPipeline:
         embedding_model: Any,
         text_segmentor: TextSegmentor,
         vector_store: VectorStore,
+        keyword_index: BM25KeywordIndex,
+        answer_cache: Optional[AnswerCache] = None,
+        document_catalog: Optional[DocumentCatalog] = None,
     ) -> None:
         """
         Create a RAG pipeline using various components
@@ -19,6 +30,9 @@ class DataPipeline:
         :param embedding_model: embedding for semantic retriever
         :param text_segmentor: text segmenting strategy
         :param vector_store: text chunk store
+        :param keyword_index: keyword index kept in sync with the vector store
+        :param answer_cache: cache of the RAG answers, invalidated when the documents change
+        :param document_catalog: catalog of the documents, used to list them without scanning the vector store
         :param prompt_template: the prompt used for RAG
         :param keyword_retriever_builder: builder for keyword-based document retriever
         :param semantic_retriever_builder: builder for semantic-based document retriever
@@ -33,17 +47,92 @@ class DataPipeline:
         # Save the vector store
         self.vector_store = vector_store
 
-    def add_single_document(self, document_path: str):
+        # Save the keyword index
+        self.keyword_index = keyword_index
+
+        # Save the answer cache
+        self.answer_cache = answer_cache
+
+        # Save the document catalog
+        self.document_catalog = document_catalog
+
+    def add_single_document(self, document_path: str, incremental: bool = True,
+                            on_stage: Optional[Callable[[str], None]] = None,
+                            on_progress: Optional[Callable[[float], None]] = None):
         """
         Add single document to the vector store
+        :param document_path: path of the markdown document
+        :param incremental: only embed the new or changed chunks of an already stored document
+        :param on_stage: called with "segmenting" then "embedding" as the document goes through them
+        :param on_progress: called with the fraction of the chunks embedded so far, after each batch
+        """
+        if on_stage is not None:
+            on_stage("segmenting")
+        if incremental:
+            text_chunks = update_vectors_single_document(document_path, self.text_segmentor, self.vector_store,
+                                                         on_stage=on_stage, on_progress=on_progress)
+        else:
+            text_chunks = add_vectors_single_document(document_path, self.text_segmentor, self.vector_store,
+                                                      on_stage=on_stage, on_progress=on_progress)
+        self.keyword_index.add_document([text_chunk.document for text_chunk in text_chunks])
+        if self.document_catalog is not None:
+            # The hash of the document is the hash of its chunk hashes, in order
+            self.document_catalog.upsert(
+                os.path.basename(document_path),
+                len(text_chunks),
+                get_content_hash("".join(text_chunk.document.metadata["content_hash"] for text_chunk in text_chunks)),
+            )
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+
+    def add_folder(self, document_folder: str) -> List[str]:
+        """
+        Add or update every document (markdown file) of a folder, only the changed chunks are embedded
+        :param document_folder: directory of the documents
+        :return: the names of the added documents
         """
-        add_vectors_single_document(document_path, self.text_segmentor, self.vector_store)
+        document_names = sorted(name for name in os.listdir(document_folder) if is_valid_document(name))
+        with self.deferred_index_save():
+            for document_name in document_names:
+                self.add_single_document(os.path.join(document_folder, document_name))
+        return document_names
+
+    @contextmanager
+    def deferred_index_save(self, on_flush: Optional[Callable[[], None]] = None):
+        """
+        Save the keyword index in batches while many documents are ingested, the cached answers
+        are invalidated again once each batch is searchable
+        :param on_flush: called after each batch is saved
+        """
+        def flushed():
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate()
+            if on_flush is not None:
+                on_flush()
+
+        with self.keyword_index.deferred_save(on_flush=flushed):
+            yield
 
     def remove_single_document(self, document_path: str):
         """
         Remove single document from the vector store
         """
         remove_vectors_single_document(document_path, self.vector_store)
+        self.keyword_index.remove_document(document_path)
+        if self.document_catalog is not None:
+            self.document_catalog.remove(os.path.basename(document_path))
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
 
     def get_all_documents(self) -> List[str]:
-        return self.vector_store.get_all_documents()
\ No newline at end of file
+        if self.document_catalog is not None:
+            return self.document_catalog.get_all_documents()
+        return self.vector_store.get_all_documents()
+
+    def get_document_catalog(self) -> List[dict]:
+        """
+        Get the chunk count, content hash and ingestion time of every document
+        """
+        if self.document_catalog is None:
+            return [{"name": name} for name in self.vector_store.get_all_documents()]
+        return self.document_catalog.get_entries()
\ No newline at end of file
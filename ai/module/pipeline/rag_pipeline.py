@@ -1,9 +1,16 @@
-from typing import Any, Dict, List
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
 from langchain.schema import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
-from module.document_retriever import DocumentRetrieverBuilder
+from langchain_core.runnables import RunnableParallel
+from module.document_retriever import (DocumentRetrieverBuilder, Reranker,
+                                       normalize_filters)
+from module.document_retriever.hybrid import DocumentFusion, select_documents
+from module.utils import run_in_thread_pool
+
+from .answer_cache import AnswerCache
 
 
 
@@ -30,6 +37,19 @@ class RAGAnswer:
         self.semantic_context = semantic_context
         self.semantic_metadata = semantic_metadata
 
+    def to_dict(self) -> Dict[str, str]:
+        """
+        Get the dictionary representation of the answer
+        :return: dictionary of the answer, context and metadata
+        """
+        return {
+            "answer": self.answer,
+            "semantic_context": self.semantic_context,
+            "semantic_metadata": self.semantic_metadata,
+            "keyword_context": self.keyword_context,
+            "keyword_metadata": self.keyword_metadata,
+        }
+
 
 def combine_results(results: Dict) -> List:
     """
@@ -56,6 +76,9 @@ class RAGPipeline:
         prompt_template: Any,
         keyword_retriever_builder: DocumentRetrieverBuilder,
         semantic_retriever_builder: DocumentRetrieverBuilder,
+        answer_cache: Optional[AnswerCache] = None,
+        document_fusion: Optional[DocumentFusion] = None,
+        reranker: Optional[Reranker] = None,
     ) -> None:
         """
         Create a RAG pipeline using various components
@@ -67,6 +90,9 @@ class RAGPipeline:
         :param prompt_template: the prompt used for RAG
         :param keyword_retriever_builder: builder for keyword-based document retriever
         :param semantic_retriever_builder: builder for semantic-based document retriever
+        :param answer_cache: optional cache of the answers of repeated questions
+        :param document_fusion: optional fusion of the retrieved documents, they are concatenated if None
+        :param reranker: optional reranker keeping the most relevant of the combined documents
         :param build_vector_store: whether to rebuild vector store or to use existing ones
         """
         # Save the document folder
@@ -75,31 +101,86 @@ class RAGPipeline:
         # Save LLMs and embeddings
         self.llm = llm_model
 
-        # Build the keyword retriever
+        # Save the answer cache
+        self.answer_cache = answer_cache
+
+        # Save the strategy used to combine the documents of the retrievers
+        self.document_fusion = document_fusion
+        self.combine_documents = document_fusion if document_fusion is not None else combine_results
+
+        # Save the reranker of the combined documents
+        self.reranker = reranker
+
+        # Build the keyword retriever, the builders are kept to retrieve batches of questions
+        self.keyword_retriever_builder = keyword_retriever_builder
+        self.semantic_retriever_builder = semantic_retriever_builder
         self.keyword_retriever = keyword_retriever_builder.build()
         self.semantic_retriever = semantic_retriever_builder.build()
         self.parallel_retriever = RunnableParallel(
             {"keyword": self.keyword_retriever, "semantic": self.semantic_retriever}
         )
 
-        # Create the pipeline
-        self.pre_rag_chain = (
-            {
-                "context": self.parallel_retriever | combine_results | format_documents,
-                "question": RunnablePassthrough(),
-            }
-            | prompt_template
-        )
-
         self.post_rag_chain = StrOutputParser()
-    
-    def rag_chain(self, model_name: str) -> Any:
-        return self.pre_rag_chain | self.llm[model_name] | self.post_rag_chain
 
-    def invoke(self, question: str, model_name: str) -> RAGAnswer:
-        # Find the relevant documents
-        docs = self.parallel_retriever.invoke(question)
+        # Build the answer chains once per model, on first use, so they are not rebuilt on
+        # every request. They take the already selected context, so retrieval only runs
+        # once per question
+        self.answer_chains = {}
+
+    def answer_chain(self, model_name: str) -> Any:
+        if model_name not in self.answer_chains:
+            self.answer_chains[model_name] = self.prompt | self.llm[model_name] | self.post_rag_chain
+        return self.answer_chains[model_name]
+
+    @staticmethod
+    def retriever_input(question: str, filters: Optional[Dict[str, Any]]) -> Union[str, Dict[str, Any]]:
+        """
+        Get the input of the retrievers, the question with its metadata filters if there are any
+        """
+        filters = normalize_filters(filters)
+        return question if filters is None else {"query": question, "filters": filters}
+
+    @staticmethod
+    def cache_scope(model_name: str, filters: Optional[Dict[str, Any]]) -> str:
+        """
+        Get the name the answers are cached under, so scoped and unscoped answers are kept apart
+        """
+        filters = normalize_filters(filters)
+        if filters is None:
+            return model_name
+        return f"{model_name}|{json.dumps(filters, sort_keys=True, default=str)}"
 
+    def select_context(self, question: str, docs: Dict) -> Tuple[Dict, str]:
+        """
+        Combine the documents of the retrievers into the context of the prompt
+        :param question: the question of the user, used by the reranker
+        :param docs: dictionary containing the results of each retriever
+        :return: the documents of each retriever that are in the context, and the context
+        """
+        context_docs = self.combine_documents(docs)
+        if self.reranker is not None:
+            context_docs = self.reranker.rerank(question, context_docs)
+        if self.document_fusion is not None or self.reranker is not None:
+            docs = select_documents(docs, context_docs)
+        return docs, format_documents(context_docs)
+
+    async def aselect_context(self, question: str, docs: Dict) -> Tuple[Dict, str]:
+        """
+        Combine the documents of the retrievers into the context of the prompt,
+        the reranker runs in the thread pool so it does not block the event loop
+        """
+        if self.reranker is None:
+            return self.select_context(question, docs)
+        return await run_in_thread_pool(self.select_context, question, docs)
+
+    @staticmethod
+    def build_answer(docs: Dict, answer: str) -> RAGAnswer:
+        """
+        Format the retrieved documents and the LLM answer into a RAG answer
+        :param docs: dictionary containing the results of each retriever
+        :param answer: the answer from the LLM
+        :return: the RAG answer
+        """
         # Separate context and metadata for each retriever
         semantic_docs = docs["semantic"]
         text_docs = docs["keyword"]
@@ -121,9 +202,6 @@ class RAGPipeline:
             ]
         )
 
-        # Get the answer from the chain
-        answer = self.rag_chain(model_name).invoke(question)
-
         # Return
         return RAGAnswer(
             answer,
@@ -132,4 +210,167 @@ class RAGPipeline:
             semantic_context,
             semantic_metadata,
         )
-    
\ No newline at end of file
+
+    def invoke(self, question: str, model_name: str, filters: Optional[Dict[str, Any]] = None) -> RAGAnswer:
+        # Return the cached answer of the same (or a similar) question
+        embedding, cache_version = None, None
+        cache_scope = self.cache_scope(model_name, filters)
+        if self.answer_cache is not None:
+            cache_version = self.answer_cache.version()
+            cached_answer, embedding = self.answer_cache.lookup(question, cache_scope)
+            if cached_answer is not None:
+                return cached_answer
+
+        # Find the relevant documents, only among the chunks matching the filters
+        docs = self.parallel_retriever.invoke(self.retriever_input(question, filters))
+
+        # Get the answer from the retrieved documents, without retrieving again
+        docs, context = self.select_context(question, docs)
+        answer = self.answer_chain(model_name).invoke(
+            {"context": context, "question": question}
+        )
+        rag_answer = self.build_answer(docs, answer)
+
+        if self.answer_cache is not None:
+            self.answer_cache.put(question, cache_scope, rag_answer, cache_version, embedding)
+        return rag_answer
+
+    async def ainvoke(self, question: str, model_name: str, filters: Optional[Dict[str, Any]] = None) -> RAGAnswer:
+        # Return the cached answer of the same (or a similar) question
+        embedding, cache_version = None, None
+        cache_scope = self.cache_scope(model_name, filters)
+        if self.answer_cache is not None:
+            cache_version = self.answer_cache.version()
+            cached_answer, embedding = await self.answer_cache.alookup(question, cache_scope)
+            if cached_answer is not None:
+                return cached_answer
+
+        # Find the relevant documents, both retrievers run concurrently
+        docs = await self.parallel_retriever.ainvoke(self.retriever_input(question, filters))
+
+        # Get the answer from the retrieved documents, without retrieving again
+        docs, context = await self.aselect_context(question, docs)
+        answer = await self.answer_chain(model_name).ainvoke(
+            {"context": context, "question": question}
+        )
+        rag_answer = self.build_answer(docs, answer)
+
+        if self.answer_cache is not None:
+            self.answer_cache.put(question, cache_scope, rag_answer, cache_version, embedding)
+        return rag_answer
+
+    async def astream(self, question: str, model_name: str,
+                      filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, str]]:
+        """
+        Stream the answer of the RAG. The retrieval context and metadata are sent first,
+        then the LLM tokens as they are generated
+        :param question: the question of the user
+        :param model_name: name of the LLM to use
+        :param filters: metadata filters (key -> value or list of values) scoping the retrieval
+        :return: async iterator of events
+        """
+        # A cached answer is sent as a single token
+        embedding, cache_version = None, None
+        cache_scope = self.cache_scope(model_name, filters)
+        if self.answer_cache is not None:
+            cache_version = self.answer_cache.version()
+            cached_answer, embedding = await self.answer_cache.alookup(question, cache_scope)
+            if cached_answer is not None:
+                context_event = cached_answer.to_dict()
+                answer = context_event.pop("answer")
+                yield {"type": "context", **context_event}
+                yield {"type": "token", "content": answer}
+                yield {"type": "done"}
+                return
+
+        # Find the relevant documents and send them before generation starts
+        docs = await self.parallel_retriever.ainvoke(self.retriever_input(question, filters))
+        docs, context = await self.aselect_context(question, docs)
+        context_event = self.build_answer(docs, "").to_dict()
+        context_event.pop("answer")
+        yield {"type": "context", **context_event}
+
+        # Stream the tokens from the LLM
+        tokens = []
+        async for token in self.answer_chain(model_name).astream(
+            {"context": context, "question": question}
+        ):
+            tokens.append(token)
+            yield {"type": "token", "content": token}
+
+        if self.answer_cache is not None:
+            self.answer_cache.put(
+                question, cache_scope, self.build_answer(docs, "".join(tokens)), cache_version, embedding
+            )
+        yield {"type": "done"}
+
+    async def abatch(self, questions: List[str], model_name: str, filters: Optional[Dict[str, Any]] = None,
+                     max_concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, Union[RAGAnswer, Exception]]]:
+        """
+        Answer many questions, yielding each answer as soon as it is ready. The questions are embedded
+        in one batched call, retrieved in bulk, and the LLM calls run with bounded concurrency
+        :param questions: the questions
+        :param model_name: name of the LLM to use
+        :param filters: metadata filters (key -> value or list of values) scoping the retrieval
+        :param max_concurrency: maximum number of LLM calls at the same time
+        :return: async iterator of (index of the question, answer or the exception raised for it)
+        """
+        if not questions:
+            return
+        filters = normalize_filters(filters)
+        cache_scope = self.cache_scope(model_name, filters)
+
+        # One embedding call for the whole batch, shared by the answer cache and the semantic retriever
+        embeddings = await self.semantic_retriever_builder.aembed_queries(questions)
+
+        # The cached answers are sent first, the lookups run in the thread pool
+        cached_answers = [None] * len(questions)
+        if self.answer_cache is not None:
+            cache_version = self.answer_cache.version()
+            cached_answers = await run_in_thread_pool(lambda: [
+                self.answer_cache.lookup_with_embedding(question, cache_scope, embedding)
+                for question, embedding in zip(questions, embeddings)
+            ])
+        pending = []
+        for index, cached_answer in enumerate(cached_answers):
+            if cached_answer is not None:
+                yield index, cached_answer
+            else:
+                pending.append(index)
+        if not pending:
+            return
+
+        # Retrieve the chunks of every question with one call per retriever
+        pending_questions = [questions[index] for index in pending]
+        keyword_docs, semantic_docs = await asyncio.gather(
+            self.keyword_retriever_builder.abatch_retrieve(pending_questions, filters),
+            self.semantic_retriever_builder.abatch_retrieve(
+                pending_questions, filters, [embeddings[index] for index in pending]
+            ),
+        )
+
+        # Select the context of every question in one thread pool call, the reranker is CPU-bound
+        def select_contexts():
+            return [
+                self.select_context(question, {"keyword": keyword, "semantic": semantic})
+                for question, keyword, semantic in zip(pending_questions, keyword_docs, semantic_docs)
+            ]
+
+        contexts = await run_in_thread_pool(select_contexts)
+
+        # The answers are yielded in the order they complete
+        inputs = [
+            {"context": context, "question": question}
+            for question, (_, context) in zip(pending_questions, contexts)
+        ]
+        async for position, answer in self.answer_chain(model_name).abatch_as_completed(
+            inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+        ):
+            index = pending[position]
+            if isinstance(answer, Exception):
+                yield index, answer
+                continue
+            rag_answer = self.build_answer(contexts[position][0], answer)
+            if self.answer_cache is not None:
+                self.answer_cache.put(questions[index], cache_scope, rag_answer, cache_version, embeddings[index])
+            yield index, rag_answer
@@ -0,0 +1,148 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements a registry that builds the components of the pipelines lazily
+"""
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class ComponentRegistry:
+    def __init__(self):
+        """
+        Create a registry of named components, each one is built once on first use
+        """
+        self.factories: Dict[str, Callable[[], Any]] = {}
+        self.components: Dict[str, Any] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """
+        Register the factory of a component
+        :param name: name of the component
+        :param factory: function without arguments that builds the component
+        """
+        self.factories[name] = factory
+        self.locks[name] = threading.Lock()
+
+    def names(self, prefix: str = "") -> List[str]:
+        """
+        Get the names of the registered components starting with the prefix
+        :param prefix: prefix of the names
+        :return: list of names
+        """
+        return [name for name in self.factories if name.startswith(prefix)]
+
+    def get(self, name: str) -> Any:
+        """
+        Get a component, building it if needed
+        :param name: name of the component
+        :return: the component
+        """
+        if name in self.components:
+            return self.components[name]
+        if name not in self.factories:
+            raise KeyError(name)
+
+        # Only one thread builds the component, the other ones wait for it
+        with self.locks[name]:
+            if name not in self.components:
+                self.components[name] = self.factories[name]()
+        return self.components[name]
+
+    def close(self):
+        """
+        Release the resources (connections, mapped files) of the built components that have any
+        """
+        for component in list(self.components.values()):
+            close = getattr(component, "close", None)
+            if callable(close):
+                close()
+
+    def warm_up(self, names: Iterable[str], max_workers: Optional[int] = None):
+        """
+        Build the components in parallel
+        :param names: names of the components to build
+        :param max_workers: maximum number of components built at the same time
+        """
+        names = list(names)
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(names), 1)) as executor:
+            list(executor.map(self.get, names))
+
+
+class LazyComponentMapping(Mapping):
+    def __init__(self, registry: ComponentRegistry, prefix: str):
+        """
+        Expose the components with a common prefix as a read-only dictionary built on access
+        :param registry: the registry of the components
+        :param prefix: the prefix of the names, removed from the keys
+        """
+        self.registry = registry
+        self.prefix = prefix
+
+    def __getitem__(self, key: str) -> Any:
+        return self.registry.get(self.prefix + key)
+
+    def __iter__(self):
+        return (name[len(self.prefix):] for name in self.registry.names(self.prefix))
+
+    def __len__(self) -> int:
+        return len(self.registry.names(self.prefix))
+
+
+class LRUComponentCache:
+    def __init__(self, factory: Callable[[str], Any], max_size: int,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        """
+        Keep the components built for a key (e.g. a tenant) in memory, evicting the least recently used ones
+        :param factory: function that builds the component of a key
+        :param max_size: maximum number of components kept in memory
+        :param on_evict: function called with each evicted component, e.g. to release its resources
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.components: "OrderedDict[str, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, key: str) -> Any:
+        """
+        Get the component of a key, building it if needed
+        :param key: the key of the component
+        :return: the component
+        """
+        with self.lock:
+            if key in self.components:
+                self.components.move_to_end(key)
+                return self.components[key]
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread builds the component of a key, without blocking the other keys
+        with key_lock:
+            with self.lock:
+                if key in self.components:
+                    return self.components[key]
+            component = self.factory(key)
+            evicted = []
+            with self.lock:
+                self.components[key] = component
+                self.components.move_to_end(key)
+                while len(self.components) > self.max_size:
+                    evicted_key, evicted_component = self.components.popitem(last=False)
+                    evicted.append(evicted_component)
+                    # Forget the lock of the evicted key, unless a thread is building it again
+                    evicted_lock = self.key_locks.get(evicted_key)
+                    if evicted_lock is not None and not evicted_lock.locked():
+                        del self.key_locks[evicted_key]
+
+        if self.on_evict is not None:
+            for evicted_component in evicted:
+                self.on_evict(evicted_component)
+        return component
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            return list(self.components)
@@ -0,0 +1,53 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file contains the naming of the data of each tenant (collection, index files and folders)
+"""
+import os
+import re
+
+from configs.config import DEFAULT_TENANT
+
+# Tenant ids are used in file paths and Chroma collection names
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """
+    Check that the tenant id is safe to use in paths and collection names
+    :param tenant_id: the tenant id
+    :return: the tenant id
+    """
+    if not TENANT_ID_PATTERN.match(tenant_id or ""):
+        raise ValueError(f"Invalid tenant {tenant_id}")
+    return tenant_id
+
+
+def get_tenant_folder(folder: str, tenant_id: str) -> str:
+    """
+    Get the folder of a tenant, the default tenant keeps the folder itself
+    :param folder: the base folder
+    :param tenant_id: the tenant id
+    :return: the folder of the tenant
+    """
+    if tenant_id == DEFAULT_TENANT:
+        return folder
+    return os.path.join(folder, "tenants", validate_tenant_id(tenant_id))
+
+
+def get_tenant_path(path: str, tenant_id: str) -> str:
+    """
+    Get the path of a file of a tenant, in the folder of the tenant
+    :param path: the path of the file for the default tenant
+    :param tenant_id: the tenant id
+    :return: the path of the file of the tenant
+    """
+    return os.path.join(get_tenant_folder(os.path.dirname(path), tenant_id), os.path.basename(path))
+
+
+def get_collection_name(tenant_id: str) -> str:
+    """
+    Get the Chroma collection of a tenant, the default tenant keeps the original collection
+    """
+    if tenant_id == DEFAULT_TENANT:
+        return "chroma_vector_store"
+    return f"tenant_{validate_tenant_id(tenant_id)}"
@@ -2,4 +2,5 @@
 Author: Trang Anh Thuan & Son Phat Tran
 This file contains the implementation of multiple text segmentor used in the project
 """
-from .segmentor import TextChunk, TextSegmentor, MarkDownHeaderSegmentor
+from .segmentor import (TextChunk, TextSegmentor, MarkDownHeaderSegmentor,
+                        TokenBoundedMarkdownSegmentor)
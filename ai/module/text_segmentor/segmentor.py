@@ -1,21 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, Iterator, List, Optional
 
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from langchain_core.documents import Document
+from module.utils import estimate_tokens
 
 class TextChunk:
-    def __init__(self, content: str, document_name: str = "", chunk_location: int = -1):
+    def __init__(self, content: str, document_name: str = "", chunk_location: int = -1,
+                 metadata: Optional[Dict] = None):
         """
         Contains the information of a text chunk
         :param content: the content of the text chunk (str)
         :param document_name: the name of the document of the text (str)
         :param chunk_location: the location of the chunk (str)
+        :param metadata: extra metadata of the chunk, such as the header breadcrumbs
         """
         self.content = content
         self.document_name = document_name
         self.chunk_location = chunk_location
-        self.document = Document(page_content=content, metadata={"source": document_name, "location": chunk_location})
+        self.document = Document(page_content=content,
+                                 metadata={**(metadata or {}), "source": document_name, "location": chunk_location})
 
     def __str__(self):
         """
@@ -58,4 +62,203 @@ class MarkDownHeaderSegmentor(TextSegmentor, ABC):
                       document_name=name,
                       chunk_location=index)
             for index, chunk in enumerate(chunks)
-        ]
\ No newline at end of file
+        ]
+
+
+def iter_lines(content: str) -> Iterator[str]:
+    """
+    Iterate over the lines of the text without splitting it into a list first
+    :param content: the text
+    :return: iterator of lines (without the new line character)
+    """
+    start = 0
+    while start < len(content):
+        end = content.find("\n", start)
+        if end == -1:
+            end = len(content)
+        yield content[start:end]
+        start = end + 1
+
+
+class TokenBoundedMarkdownSegmentor(TextSegmentor, ABC):
+    def __init__(self, max_tokens: int = 512, min_tokens: int = 64, overlap_tokens: int = 64,
+                 max_header_level: int = 3):
+        """
+        Create a Markdown segmentor that splits on headers and bounds the size of the chunks
+        :param max_tokens: maximum estimated number of tokens of a chunk
+        :param min_tokens: chunks smaller than this are merged with the next section or chunk
+        :param overlap_tokens: number of tokens repeated at the start of the next chunk of a long section
+        :param max_header_level: deepest header level used to split the document
+        """
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be non-negative and smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_header_level = max_header_level
+
+    def _parse_header(self, line: str):
+        """
+        Get the level and title of a header line, None if the line is not a splitting header
+        """
+        stripped = line.lstrip()
+        level = len(stripped) - len(stripped.lstrip("#"))
+        if 0 < level <= self.max_header_level and stripped[level:level + 1] in (" ", "\t"):
+            return level, stripped[level:].strip()
+        return None
+
+    @staticmethod
+    def _update_fence(line: str, fence: Optional[str]) -> Optional[str]:
+        """
+        Get the code fence the document is in after the line, None outside of code blocks
+        :param line: the current line
+        :param fence: the fence (e.g. ```) of the current code block, None outside of code blocks
+        """
+        stripped = line.strip()
+        if fence is None:
+            for marker in ("`", "~"):
+                if stripped.startswith(marker * 3):
+                    return marker * (len(stripped) - len(stripped.lstrip(marker)))
+            return None
+
+        # A block is closed by a line of the same fence character, at least as long as the opening fence
+        if stripped.startswith(fence) and stripped == fence[0] * len(stripped):
+            return None
+        return fence
+
+    def _split_long_line(self, line: str) -> Iterator[str]:
+        """
+        Split a line that does not fit in a chunk at white spaces, a blank line is kept as a separator
+        """
+        if not line.strip():
+            yield ""
+            return
+        max_chars = self.max_tokens * 4
+        while estimate_tokens(line) > self.max_tokens:
+            cut = line.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        if line:
+            yield line
+
+    def _iter_pieces(self, content: str) -> Iterator[tuple]:
+        """
+        Iterate over the (line, breadcrumb, starts a new section) of the document
+        """
+        headers = []
+        new_section = False
+        fence = None
+        for line in iter_lines(content):
+            # The "#" lines of code blocks (e.g. shell comments) are not headers
+            header = self._parse_header(line) if fence is None else None
+            fence = self._update_fence(line, fence)
+            if header is not None:
+                level, title = header
+                headers = [item for item in headers if item[0] < level] + [header]
+                new_section = True
+                continue
+            breadcrumb = " > ".join(title for _, title in headers)
+            for piece in self._split_long_line(line):
+                yield piece, breadcrumb, new_section
+                new_section = False
+
+    @staticmethod
+    def _join(lines: List[str]) -> str:
+        """
+        Join the lines of a chunk, without the blank lines at its start and end
+        """
+        start, end = 0, len(lines)
+        while start < end and not lines[start]:
+            start += 1
+        while end > start and not lines[end - 1]:
+            end -= 1
+        return "\n".join(lines[start:end])
+
+    def _find_split(self, lines: List[str], line_tokens: int) -> int:
+        """
+        Find where to split a chunk that cannot take the next line: the last blank line after which
+        the end of the chunk still fits with the next line, or the end of the chunk
+        :return: index of the first line of the next chunk
+        """
+        tail_tokens = 0
+        for index in range(len(lines) - 1, 0, -1):
+            if not lines[index]:
+                return index + 1
+            tail_tokens += estimate_tokens(lines[index])
+            if tail_tokens + line_tokens > self.max_tokens:
+                break
+        return len(lines)
+
+    def _iter_raw_chunks(self, content: str) -> Iterator[tuple]:
+        """
+        Iterate over the (text, breadcrumb) of the chunks, before merging the small ones
+        """
+        lines, tokens, breadcrumb = [], 0, ""
+        for line, line_breadcrumb, new_section in self._iter_pieces(content):
+            line_tokens = estimate_tokens(line)
+
+            # A new section starts a new chunk, unless the current one is too small
+            if new_section and tokens >= self.min_tokens:
+                yield self._join(lines), breadcrumb
+                lines, tokens = [], 0
+
+            # A long section is split at its last paragraph break if possible, the last lines
+            # before the split are repeated in the next chunk
+            if lines and tokens + line_tokens > self.max_tokens:
+                split = self._find_split(lines, line_tokens)
+                head, tail = lines[:split], lines[split:]
+                yield self._join(head), breadcrumb
+                tail_tokens = sum(estimate_tokens(tail_line) for tail_line in tail)
+                overlap, overlap_size = [], 0
+                for previous_line in reversed(head):
+                    previous_tokens = estimate_tokens(previous_line)
+                    if (overlap_size + previous_tokens > self.overlap_tokens
+                            or overlap_size + previous_tokens + tail_tokens + line_tokens > self.max_tokens):
+                        break
+                    overlap.insert(0, previous_line)
+                    overlap_size += previous_tokens
+                lines, tokens = overlap + tail, overlap_size + tail_tokens
+
+            # The chunk takes the breadcrumb of its latest section
+            breadcrumb = line_breadcrumb
+            lines.append(line)
+            tokens += line_tokens
+
+        if lines:
+            yield self._join(lines), breadcrumb
+
+    def iter_segments(self, name: str, content: str) -> Iterator[TextChunk]:
+        """
+        Lazily split the text from document into chunks
+        :param name: the name of the document
+        :param content: the text of the document
+        :return: iterator of text chunks
+        """
+        location = 0
+        pending = None
+        for text, breadcrumb in self._iter_raw_chunks(content):
+            if not text.strip():
+                continue
+            # Merge a small chunk with the previous one when they fit together
+            if (pending is not None
+                    and estimate_tokens(text) < self.min_tokens
+                    and estimate_tokens(pending[0]) + estimate_tokens(text) <= self.max_tokens):
+                pending = (pending[0] + "\n\n" + text, pending[1])
+                continue
+            if pending is not None:
+                yield TextChunk(pending[0], name, location, metadata={"headers": pending[1]})
+                location += 1
+            pending = (text, breadcrumb)
+        if pending is not None:
+            yield TextChunk(pending[0], name, location, metadata={"headers": pending[1]})
+
+    def segment(self, name: str, content: str) -> List[TextChunk]:
+        """
+        Split the text from document into chunks
+        :param name: the name of the document
+        :param content: the text of the document
+        :return: list of text chunk
+        """
+        return list(self.iter_segments(name, content))
@@ -0,0 +1,6 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file contains helpers shared across the modules of the project
+"""
+from .executor import get_thread_pool, run_in_thread_pool
+from .tokens import estimate_tokens, truncate_to_tokens
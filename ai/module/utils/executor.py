@@ -0,0 +1,31 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from configs.config import THREAD_POOL_SIZE
+
+_thread_pool = None
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """
+    Get the bounded thread pool used to run blocking calls from async code
+    :return: the shared thread pool
+    """
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=THREAD_POOL_SIZE, thread_name_prefix="rag-worker"
+        )
+    return _thread_pool
+
+
+async def run_in_thread_pool(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the shared thread pool without blocking the event loop
+    :param func: the blocking function
+    :return: the result of the function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(), partial(func, *args, **kwargs))
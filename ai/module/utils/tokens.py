@@ -0,0 +1,19 @@
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens of a text (about 4 characters per token)
+    :param text: the text
+    :return: estimated number of tokens
+    """
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut a text so its estimated number of tokens is at most max_tokens
+    :param text: the text
+    :param max_tokens: maximum estimated number of tokens
+    :return: the text, cut if needed
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens - 1) * 4]
@@ -3,3 +3,4 @@ Author: Trang Anh Thuan & Son Phat Tran
 This file implements the various vector store for storing the text chunks
 """
 from .stores import VectorStore, ChromaClientVectorStore
+from .local import LocalVectorStore
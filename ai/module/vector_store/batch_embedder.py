@@ -0,0 +1,121 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements a batched, concurrent and rate-limit-aware embedder for document ingestion
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from chromadb import Documents, Embeddings
+from module.utils import estimate_tokens
+
+THROTTLING_MARKERS = ("429", "rate limit", "ratelimit", "quota", "resource exhausted", "too many requests")
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Check if an error comes from the provider throttling the requests
+    :param error: the raised error
+    :return: True if the request should be retried later, false otherwise
+    """
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in THROTTLING_MARKERS)
+
+
+class BatchEmbedder:
+    def __init__(
+        self,
+        embedding_function: Callable[[Documents], Embeddings],
+        max_batch_size: int = 100,
+        max_batch_tokens: int = 8000,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+    ):
+        """
+        Create an embedder that splits texts into batches and embeds them concurrently
+        :param embedding_function: function that embeds a list of texts
+        :param max_batch_size: maximum number of texts per request
+        :param max_batch_tokens: maximum estimated number of tokens per request
+        :param max_concurrency: maximum number of requests running at the same time
+        :param max_retries: maximum number of retries of a throttled request
+        :param base_delay: delay (seconds) before the first retry, doubled after each retry
+        """
+        self.embedding_function = embedding_function
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    def make_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Split the texts into batches by count and by estimated tokens
+        :param texts: the texts to embed
+        :return: list of batches, each batch is a list of text indexes
+        """
+        batches = []
+        current_batch, current_tokens = [], 0
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current_batch and (
+                len(current_batch) >= self.max_batch_size
+                or current_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append(current_batch)
+                current_batch, current_tokens = [], 0
+            current_batch.append(index)
+            current_tokens += tokens
+        if current_batch:
+            batches.append(current_batch)
+        return batches
+
+    def _embed_with_retry(self, texts: List[str]) -> Embeddings:
+        """
+        Embed a single batch, retrying with exponential backoff when throttled
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embedding_function(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_throttling_error(e):
+                    raise
+                delay = self.base_delay * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+
+    def embed_batches(self, texts: List[str],
+                      on_progress: Optional[Callable[[float], None]] = None) -> Iterator[Tuple[List[int], Embeddings]]:
+        """
+        Embed the texts concurrently and yield each batch as soon as it is done
+        :param texts: the texts to embed
+        :param on_progress: called with the fraction of the texts embedded so far after each batch
+        :return: iterator of (text indexes, embeddings) for each batch
+        """
+        batches = self.make_batches(texts)
+        embedded_count = 0
+
+        def report(batch: List[int]):
+            nonlocal embedded_count
+            embedded_count += len(batch)
+            if on_progress is not None:
+                on_progress(embedded_count / len(texts))
+
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            for batch in batches:
+                batch_embeddings = self._embed_with_retry([texts[index] for index in batch])
+                report(batch)
+                yield batch, batch_embeddings
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(self._embed_with_retry, [texts[index] for index in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch_embeddings = future.result()
+                report(futures[future])
+                yield futures[future], batch_embeddings
@@ -0,0 +1,116 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements the catalog of the documents stored in the vector store
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .stores import VectorStore
+
+
+class DocumentCatalog:
+    def __init__(self, db_path: str):
+        """
+        Create a catalog with the chunk count, content hash and ingestion time of each document,
+        so the documents can be listed without scanning the chunks of the vector store
+        :param db_path: path of the SQLite database, shared by the server and the workers
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "name TEXT PRIMARY KEY, chunk_count INTEGER, content_hash TEXT, ingested_at REAL, updated_at REAL)"
+        )
+        self.connection.commit()
+
+    def upsert(self, name: str, chunk_count: int, content_hash: Optional[str]):
+        """
+        Record that a document has been added or updated
+        :param name: the source of the document
+        :param chunk_count: number of chunks of the document
+        :param content_hash: hash of the content of the document
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO documents (name, chunk_count, content_hash, ingested_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                "chunk_count = excluded.chunk_count, content_hash = excluded.content_hash, "
+                "updated_at = excluded.updated_at",
+                (name, chunk_count, content_hash, now, now),
+            )
+            self.connection.commit()
+
+    def remove(self, name: str):
+        """
+        Record that a document has been removed
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM documents WHERE name = ?", (name,))
+            self.connection.commit()
+
+    def get_all_documents(self) -> List[str]:
+        """
+        Get the names of all the documents
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT name FROM documents ORDER BY name").fetchall()
+        return [name for name, in rows]
+
+    def get_entries(self) -> List[Dict]:
+        """
+        Get the catalog entry of every document
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT name, chunk_count, content_hash, ingested_at, updated_at FROM documents ORDER BY name"
+            ).fetchall()
+        return [
+            {
+                "name": name,
+                "chunk_count": chunk_count,
+                "content_hash": content_hash,
+                "ingested_at": ingested_at,
+                "updated_at": updated_at,
+            }
+            for name, chunk_count, content_hash, ingested_at, updated_at in rows
+        ]
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def rebuild(self, vector_store: VectorStore):
+        """
+        Fill the catalog from a single scan of the chunk metadata, for stores ingested before the catalog existed
+        :param vector_store: the vector store
+        """
+        chunk_counts = Counter(
+            metadata["source"]
+            for metadata in vector_store.get_vector_store_metadata()
+            if metadata and "source" in metadata
+        )
+        now = time.time()
+        with self.lock:
+            self.connection.execute("DELETE FROM documents")
+            self.connection.executemany(
+                "INSERT INTO documents (name, chunk_count, content_hash, ingested_at, updated_at) "
+                "VALUES (?, ?, NULL, ?, ?)",
+                [(name, count, now, now) for name, count in chunk_counts.items()],
+            )
+            self.connection.commit()
+
+    def close(self):
+        """
+        Close the connection to the database
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,129 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements a two-tier (in-memory LRU and on-disk SQLite) cache for embeddings
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: str, max_memory_items: int = 10000):
+        """
+        Create an embedding cache keyed by the model name and a hash of the text
+        :param db_path: path of the SQLite database used as the on-disk tier
+        :param max_memory_items: maximum number of embeddings kept in the in-memory tier
+        """
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters for the cache metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(model_name: str, text: str, kind: str = "document") -> str:
+        """
+        Get the cache key of a text for a model
+        :param model_name: name of the embedding model
+        :param text: the embedded text
+        :param kind: "document" or "query", some models (e.g. Gemini) embed them differently
+        :return: the key (str)
+        """
+        # The document keys are unchanged, so the embeddings cached before the queries were separated are kept
+        if kind == "document":
+            return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        """
+        Put an embedding in the in-memory tier and evict the least recently used ones
+        """
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str], kind: str = "document") -> List[Optional[List[float]]]:
+        """
+        Get the cached embeddings of the texts
+        :param model_name: name of the embedding model
+        :param texts: the texts to look up
+        :param kind: "document" or "query"
+        :return: the embedding of each text, None when it is not cached
+        """
+        keys = [self.get_key(model_name, text, kind) for text in texts]
+        results: Dict[str, List[float]] = {}
+        with self.lock:
+            # Look up the in-memory tier first
+            disk_keys = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    results[key] = self.memory[key]
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+
+            # Then look up the remaining keys on disk
+            for start in range(0, len(disk_keys), 500):
+                batch = disk_keys[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    results[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+            self.misses += len(disk_keys) - sum(1 for key in disk_keys if key in results)
+        return [results.get(key) for key in keys]
+
+    def set_many(self, model_name: str, texts: List[str], vectors: List[List[float]], kind: str = "document"):
+        """
+        Save the embeddings of the texts in both tiers
+        :param model_name: name of the embedding model
+        :param texts: the embedded texts
+        :param vectors: the embedding of each text
+        :param kind: "document" or "query"
+        """
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = self.get_key(model_name, text, kind)
+                vector = list(vector)
+                self._remember(key, vector)
+                rows.append((key, model_name, array("f", vector).tobytes()))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows
+            )
+            self.connection.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the hit and miss counters of the cache
+        :return: dictionary of the metrics
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -2,20 +2,54 @@
 Author: Trang Anh Thuan & Son Phat Tran
 This document creates custom embedding function wrappers for different LLMs
 """
+import asyncio
+from typing import Optional
+
 from chromadb import Documents, EmbeddingFunction, Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_openai import OpenAIEmbeddings
+from module.utils import run_in_thread_pool
+from module.vector_store.embedding_cache import EmbeddingCache
 
 
 class EmbeddingFunctionWrapper(EmbeddingFunction):
     """Base class for custom embedding functions"""
-    def __init__(self, embedding_model: GoogleGenerativeAIEmbeddings | OpenAIEmbeddings | OllamaEmbeddings):
+    def __init__(self,
+                 embedding_model: GoogleGenerativeAIEmbeddings | OpenAIEmbeddings | OllamaEmbeddings,
+                 cache: Optional[EmbeddingCache] = None):
         """
         Initialize with any LangChain compatible embedding model
         :param embedding_model: LangChain embedding model instance
+        :param cache: optional cache so the same text is only embedded once per model
         """
         self.embeddings = embedding_model
+        self.cache = cache
+        self.model_name = f"{type(embedding_model).__name__}:{getattr(embedding_model, 'model', '')}"
+
+    def _get_cached(self, input: Documents, kind: str = "document"):
+        """
+        Split the input into cached embeddings and texts that still need to be embedded
+        :param input: List of text documents
+        :param kind: "document" or "query", cached separately since some models embed them differently
+        :return: the embeddings (None when missing) and the indexes of the missing texts
+        """
+        if self.cache is None:
+            return [None] * len(input), list(range(len(input)))
+        embeddings = self.cache.get_many(self.model_name, input, kind)
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        return embeddings, missing
+
+    def _fill_missing(self, input: Documents, embeddings: Embeddings, missing, new_embeddings: Embeddings,
+                      kind: str = "document"):
+        """
+        Put the new embeddings in place and save them in the cache
+        """
+        for index, embedding in zip(missing, new_embeddings):
+            embeddings[index] = embedding
+        if self.cache is not None and missing:
+            self.cache.set_many(self.model_name, [input[index] for index in missing], new_embeddings, kind)
+        return embeddings
 
     def __call__(self, input: Documents) -> Embeddings:
         """
@@ -25,12 +59,64 @@ class EmbeddingFunctionWrapper(EmbeddingFunction):
         """
         if isinstance(input, str):
             input = [input]
-        return self.embeddings.embed_documents(input)
-    
+        embeddings, missing = self._get_cached(input)
+        new_embeddings = self.embeddings.embed_documents([input[index] for index in missing]) if missing else []
+        return self._fill_missing(input, embeddings, missing, new_embeddings)
+
     def embed_query(self, text: str) -> Embeddings:
         """
         Generate embedding for a single query text
         :param text: Query text to embed
         :return: Embedding vector
         """
-        return self.embeddings.embed_query(text)
\ No newline at end of file
+        embeddings, missing = self._get_cached([text], "query")
+        if not missing:
+            return embeddings[0]
+        return self._fill_missing([text], embeddings, missing, [self.embeddings.embed_query(text)], "query")[0]
+
+    async def aembed_documents(self, input: Documents) -> Embeddings:
+        """
+        Asynchronously generate embeddings for input documents, the cache is read and written
+        in the thread pool so SQLite does not block the event loop
+        :param input: List of text documents
+        :return: List of embeddings
+        """
+        if isinstance(input, str):
+            input = [input]
+        embeddings, missing = await run_in_thread_pool(self._get_cached, input)
+        new_embeddings = await self.embeddings.aembed_documents([input[index] for index in missing]) if missing else []
+        return await run_in_thread_pool(self._fill_missing, input, embeddings, missing, new_embeddings)
+
+    async def aembed_query(self, text: str) -> Embeddings:
+        """
+        Asynchronously generate embedding for a single query text
+        :param text: Query text to embed
+        :return: Embedding vector
+        """
+        embeddings, missing = await run_in_thread_pool(self._get_cached, [text], "query")
+        if not missing:
+            return embeddings[0]
+        new_embeddings = [await self.embeddings.aembed_query(text)]
+        return (await run_in_thread_pool(self._fill_missing, [text], embeddings, missing, new_embeddings, "query"))[0]
+
+    async def _aembed_missing_queries(self, texts: Documents) -> Embeddings:
+        """
+        Embed many queries, in one call when the model supports it
+        """
+        if isinstance(self.embeddings, GoogleGenerativeAIEmbeddings):
+            # Gemini embeds a batch as queries with the retrieval_query task type
+            return await run_in_thread_pool(self.embeddings.embed_documents, texts, task_type="retrieval_query")
+        if isinstance(self.embeddings, (OpenAIEmbeddings, OllamaEmbeddings)):
+            # These models embed queries and documents the same way
+            return await self.embeddings.aembed_documents(texts)
+        return list(await asyncio.gather(*(self.embeddings.aembed_query(text) for text in texts)))
+
+    async def aembed_queries(self, input: Documents) -> Embeddings:
+        """
+        Asynchronously generate the query embeddings of many texts, the same vectors as aembed_query
+        :param input: List of query texts
+        :return: List of embeddings
+        """
+        embeddings, missing = await run_in_thread_pool(self._get_cached, input, "query")
+        new_embeddings = await self._aembed_missing_queries([input[index] for index in missing]) if missing else []
+        return await run_in_thread_pool(self._fill_missing, input, embeddings, missing, new_embeddings, "query")
@@ -2,8 +2,9 @@
 Author: Trang Anh Thuan & Son Phat Tran
 This file contains the logic for loading and saving text chunk for all documents within a folder
 """
+import hashlib
 import os
-from typing import List
+from typing import Callable, List, Optional
 
 from module.text_segmentor import TextChunk, TextSegmentor
 from module.vector_store import VectorStore
@@ -29,20 +30,96 @@ def read_doc(file_path: str) -> str:
     return text
 
 
-def add_vectors_single_document(document_path: str,
-                                text_segmentor: TextSegmentor,
-                                vector_store: VectorStore) -> List[TextChunk]:
+def get_content_hash(text: str) -> str:
     """
-    Add vectors from a new (single) document to vector store
+    Get the hash of the content of a text chunk
+    :param text: the content of the chunk
+    :return: the hash (str)
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def segment_document(document_path: str, text_segmentor: TextSegmentor) -> List[TextChunk]:
+    """
+    Read a document and split it into text chunks, each one tagged with the hash of its content
     """
     # Read document and get vectors
     doc_content = read_doc(document_path)
 
     # Read to all text chunks
     text_chunks = text_segmentor.segment(os.path.basename(document_path), doc_content)
+    for text_chunk in text_chunks:
+        text_chunk.document.metadata["content_hash"] = get_content_hash(text_chunk.content)
+    return text_chunks
+
+
+def add_vectors_single_document(document_path: str,
+                                text_segmentor: TextSegmentor,
+                                vector_store: VectorStore,
+                                on_stage: Optional[Callable[[str], None]] = None,
+                                on_progress: Optional[Callable[[float], None]] = None) -> List[TextChunk]:
+    """
+    Add vectors from a new (single) document to vector store
+    """
+    text_chunks = segment_document(document_path, text_segmentor)
+    if on_stage is not None:
+        on_stage("embedding")
 
     # Save to vector store
-    vector_store.add_multiple_documents([text_chunk.document for text_chunk in text_chunks])
+    vector_store.add_multiple_documents([text_chunk.document for text_chunk in text_chunks], on_progress=on_progress)
+    return text_chunks
+
+
+def update_vectors_single_document(document_path: str,
+                                   text_segmentor: TextSegmentor,
+                                   vector_store: VectorStore,
+                                   on_stage: Optional[Callable[[str], None]] = None,
+                                   on_progress: Optional[Callable[[float], None]] = None) -> List[TextChunk]:
+    """
+    Add or update the vectors of a (single) document, only embedding the chunks whose content is new
+    """
+    text_chunks = segment_document(document_path, text_segmentor)
+    if on_stage is not None:
+        on_stage("embedding")
+    existing_chunks = vector_store.get_document_chunks(os.path.basename(document_path))
+
+    # Embeddings of the stored chunks, by content
+    stored_embeddings = {
+        chunk["content_hash"]: chunk["embedding"]
+        for chunk in existing_chunks.values()
+        if chunk["content_hash"] is not None
+    }
+
+    reused_documents, reused_embeddings, new_documents = [], [], []
+    new_ids = set()
+    for text_chunk in text_chunks:
+        document = text_chunk.document
+        chunk_id = f"{document.metadata['source']}_{document.metadata['location']}"
+        content_hash = document.metadata["content_hash"]
+        new_ids.add(chunk_id)
+
+        # Unchanged chunk at the same location
+        existing_chunk = existing_chunks.get(chunk_id, {})
+        if existing_chunk.get("content_hash") == content_hash:
+            if existing_chunk.get("metadata") == document.metadata:
+                continue
+            # Same content with new metadata (e.g. a renamed parent header), its embedding is reused
+            reused_documents.append(document)
+            reused_embeddings.append(existing_chunk["embedding"])
+            continue
+
+        # Known content at another location, the stored embedding is reused
+        if content_hash in stored_embeddings:
+            reused_documents.append(document)
+            reused_embeddings.append(stored_embeddings[content_hash])
+        else:
+            new_documents.append(document)
+
+    # Delete the stale chunks in one batch, then write the moved and new chunks
+    vector_store.delete_ids([chunk_id for chunk_id in existing_chunks if chunk_id not in new_ids])
+    if reused_documents:
+        vector_store.upsert_multiple_documents(reused_documents, embeddings=reused_embeddings)
+    vector_store.upsert_multiple_documents(new_documents, on_progress=on_progress)
     return text_chunks
 
 
@@ -54,43 +131,3 @@ def remove_vectors_single_document(document_path: str,
     # Remove documents
     vector_store.delete_document(document_path)
 
-
-def persist_vectors(document_folder: str,
-                    text_segmentor: TextSegmentor,
-                    vector_store: VectorStore) -> List[TextChunk]:
-    """
-    Read documents (markdown files) from a folder, convert it into text chunk,
-    and save the chunks using vector store
-    :param document_folder: directory of the documents
-    :param text_segmentor
-    :param vector_store
-    :return:
-    """
-    # Read the files from document folder
-    documents = os.listdir(document_folder)
-
-    # Only keeps the valid documents
-    filtered_documents = [doc for doc in documents if is_valid_document(doc)]
-
-    # Save the chunks
-    all_text_chunks = []
-
-    # Convert to segment and save documents
-    for doc_name in filtered_documents:
-        # Read the document
-        full_doc_path = os.path.join(document_folder, doc_name)
-        doc_content = read_doc(full_doc_path)
-
-        # Read to all text chunks
-        text_chunks = text_segmentor.segment(doc_content)
-
-        # Format the chunks
-        for chunk in text_chunks:
-            chunk.document_name = full_doc_path
-
-        all_text_chunks.extend(text_chunks)
-
-    # Finally save into vector store
-    vector_store.save(all_text_chunks)
-    return all_text_chunks
-
@@ -0,0 +1,538 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file implements an in-process vector store keeping the embeddings in a memory-mapped matrix,
+so single-node deployments do not need a separate Chroma server
+"""
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.runnable import RunnableLambda
+from langchain_core.documents import Document
+from loguru import logger
+from module.utils import run_in_thread_pool
+from module.vector_store.batch_embedder import BatchEmbedder
+
+from .stores import VectorStore
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(
+        self,
+        folder: str,
+        embedding_function,
+        batch_embedder: Optional[BatchEmbedder] = None,
+        index_type: str = "flat",
+        index_min_size: int = 50000,
+        compact_ratio: float = 0.3,
+    ):
+        """
+        Create a vector store with the normalized float32 embeddings in a memory-mapped file
+        and the text and metadata of the chunks in a SQLite table
+        :param folder: folder of the store, shared by the server and the workers
+        :param embedding_function: embedding function to use for the vector store
+        :param batch_embedder: optional embedder used to add documents in concurrent batches
+        :param index_type: "flat" for exact search, "hnsw" for an approximate index (needs hnswlib)
+        :param index_min_size: minimum number of chunks before the HNSW index is used
+        :param compact_ratio: fraction of deleted rows above which the embeddings file is compacted
+        """
+        if index_type not in ("flat", "hnsw"):
+            raise ValueError(f"Index type {index_type} not found")
+        if index_type == "hnsw" and hnswlib is None:
+            logger.warning("hnswlib is not installed, falling back to exact search")
+            index_type = "flat"
+
+        self.folder = folder
+        self.embedding_function = embedding_function
+        self.batch_embedder = batch_embedder
+        self.index_type = index_type
+        self.index_min_size = index_min_size
+        self.compact_ratio = compact_ratio
+
+        self.embeddings_path = os.path.join(folder, "embeddings.f32")
+        self.lock_path = os.path.join(folder, "store.lock")
+        os.makedirs(folder, exist_ok=True)
+
+        self.connection = sqlite3.connect(os.path.join(folder, "chunks.db"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT, source TEXT, text TEXT, metadata TEXT, deleted INTEGER DEFAULT 0)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_chunks_id ON chunks (id)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_chunks_source ON chunks (source)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.commit()
+
+        # Lock for the threads of this process, the file lock is used between processes
+        self.thread_lock = threading.RLock()
+        self.loaded_version = None
+        self.loaded_layout = None
+        self.dimension = None
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        # HNSW index labelled by row number, and the rows it holds that are not marked as deleted
+        self.index = None
+        self.index_labels = np.zeros(0, dtype=bool)
+        with self.thread_lock:
+            self._refresh()
+
+    @contextmanager
+    def _file_locked(self, mode: int):
+        """
+        Hold the inter-process file lock, exclusive (LOCK_EX) to write or shared (LOCK_SH) to read
+        """
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the thread lock and the inter-process file lock
+        """
+        with self.thread_lock:
+            with self._file_locked(fcntl.LOCK_EX):
+                yield
+
+    @contextmanager
+    def _shared_locked(self):
+        """
+        Hold the thread lock and a shared file lock, so no other process writes to the store meanwhile
+        """
+        with self.thread_lock:
+            with self._file_locked(fcntl.LOCK_SH):
+                yield
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _bump_version(self):
+        self._set_meta("version", int(self._get_meta("version") or 0) + 1)
+
+    def _row_count(self) -> int:
+        row = self.connection.execute("SELECT MAX(row) FROM chunks").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _refresh(self):
+        """
+        Map the embeddings file again if the store has been changed, possibly by another process
+        """
+        version = self._get_meta("version")
+        if version == self.loaded_version:
+            return
+
+        dimension = self._get_meta("dimension")
+        self.dimension = int(dimension) if dimension is not None else None
+        row_count = self._row_count()
+        if self.dimension is None or row_count == 0:
+            self.matrix = np.zeros((0, self.dimension or 0), dtype=np.float32)
+        else:
+            self.matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode="r",
+                                    shape=(row_count, self.dimension))
+
+        self.alive = np.zeros(row_count, dtype=bool)
+        alive_rows = [row for row, in self.connection.execute("SELECT row FROM chunks WHERE deleted = 0")]
+        self.alive[alive_rows] = True
+
+        # The row numbers only change on compaction, the index is then rebuilt on the next search,
+        # otherwise it is updated incrementally
+        layout = self._get_meta("layout")
+        if layout != self.loaded_layout or (self.index is not None and self.index.dim != self.dimension):
+            self.index = None
+        self.loaded_version = version
+        self.loaded_layout = layout
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        """
+        Convert the embeddings to unit-length float32 rows so the dot product is the cosine similarity
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1)
+
+    def _embed(self, texts: List[str], on_progress: Optional[Callable[[float], None]] = None) -> np.ndarray:
+        """
+        Embed the texts, in concurrent batches if a batch embedder is set
+        """
+        if self.batch_embedder is None:
+            return self._normalize(self.embedding_function(texts))
+        embeddings = [None] * len(texts)
+        for batch, batch_embeddings in self.batch_embedder.embed_batches(texts, on_progress):
+            for index, embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding
+        return self._normalize(embeddings)
+
+    def _write_documents(self, documents: List[Document], embeddings: Optional[List] = None,
+                         on_progress: Optional[Callable[[float], None]] = None):
+        """
+        Append the chunks to the store, the previous rows of the same ids are marked as deleted
+        """
+        if not documents:
+            return
+        ids = [f"{doc.metadata['source']}_{doc.metadata['location']}" for doc in documents]
+        texts = [doc.page_content for doc in documents]
+
+        # Embed outside of the lock so the searches are not blocked
+        matrix = self._embed(texts, on_progress) if embeddings is None else self._normalize(embeddings)
+
+        with self._locked():
+            self._refresh()
+            if self.dimension is None:
+                self.dimension = matrix.shape[1]
+                self._set_meta("dimension", self.dimension)
+            elif matrix.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the store ({self.dimension})")
+
+            self._mark_deleted("id", ids)
+
+            # Drop the rows of an interrupted write before appending
+            row_count = self._row_count()
+            with open(self.embeddings_path, "ab") as output_file:
+                output_file.truncate(row_count * self.dimension * 4)
+                output_file.write(matrix.tobytes())
+
+            self.connection.executemany(
+                "INSERT INTO chunks (row, id, source, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (row_count + offset, chunk_id, doc.metadata["source"], text, json.dumps(doc.metadata))
+                    for offset, (chunk_id, doc, text) in enumerate(zip(ids, documents, texts))
+                ],
+            )
+            self._bump_version()
+            self.connection.commit()
+            self._refresh()
+
+    def _mark_deleted(self, column: str, values: List[str]) -> int:
+        """
+        Mark the rows whose column is one of the values as deleted, without committing
+        :return: number of deleted rows
+        """
+        deleted = 0
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            cursor = self.connection.execute(
+                f"UPDATE chunks SET deleted = 1 WHERE deleted = 0 AND {column} IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            deleted += cursor.rowcount
+        return deleted
+
+    def _delete(self, column: str, values: List[str]):
+        """
+        Delete the rows whose column is one of the values, and compact the store if needed
+        """
+        if not values:
+            return
+        with self._locked():
+            if self._mark_deleted(column, values) == 0:
+                return
+            self._bump_version()
+            self.connection.commit()
+            self._refresh()
+
+            deleted_count = int((~self.alive).sum())
+            if deleted_count > self.compact_ratio * len(self.alive):
+                self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the embeddings file without the deleted rows, must be called with the lock held
+        """
+        alive_rows = np.flatnonzero(self.alive)
+        temp_path = self.embeddings_path + ".tmp"
+        with open(temp_path, "wb") as output_file:
+            for start in range(0, len(alive_rows), 10000):
+                output_file.write(np.ascontiguousarray(self.matrix[alive_rows[start:start + 10000]]).tobytes())
+
+        # Renumber the rows in ascending order, so a new row number is never in use
+        self.connection.execute("DELETE FROM chunks WHERE deleted = 1")
+        self.connection.executemany(
+            "UPDATE chunks SET row = ? WHERE row = ?",
+            [(new_row, int(old_row)) for new_row, old_row in enumerate(alive_rows) if new_row != old_row],
+        )
+        self._bump_version()
+        self._set_meta("layout", int(self._get_meta("layout") or 0) + 1)
+        os.replace(temp_path, self.embeddings_path)
+        self.connection.commit()
+        self._refresh()
+
+    def compact(self):
+        """
+        Rewrite the embeddings file without the deleted rows
+        """
+        with self._locked():
+            self._refresh()
+            self._compact()
+
+    def close(self):
+        """
+        Close the database and release the mapped embeddings and the index
+        """
+        with self.thread_lock:
+            self.connection.close()
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.alive = np.zeros(0, dtype=bool)
+            self.index = None
+
+    def add_multiple_documents(self, documents: List[Document],
+                               on_progress: Optional[Callable[[float], None]] = None):
+        """
+        Add multiple documents to the vector store
+        :param documents: the chunks to write
+        :param on_progress: called with the fraction of the chunks embedded so far, with a batch embedder
+        """
+        self._write_documents(documents, on_progress=on_progress)
+
+    def upsert_multiple_documents(self, documents: List[Document], embeddings: Optional[List] = None,
+                                  on_progress: Optional[Callable[[float], None]] = None):
+        """
+        Add or replace multiple documents in the vector store
+        :param documents: the chunks to write
+        :param embeddings: embeddings of the chunks, they are computed if None
+        :param on_progress: called with the fraction of the chunks embedded so far, with a batch embedder
+        """
+        self._write_documents(documents, embeddings, on_progress)
+
+    def get_vector_store_metadata(self) -> List:
+        """
+        Get the metadata of the vector store
+        """
+        with self.thread_lock:
+            rows = self.connection.execute("SELECT metadata FROM chunks WHERE deleted = 0 ORDER BY row").fetchall()
+        return [json.loads(metadata) for metadata, in rows]
+
+    def get_vector_store_documents(self) -> List[str]:
+        """
+        Get the documents from the vector store
+        """
+        with self.thread_lock:
+            rows = self.connection.execute("SELECT text FROM chunks WHERE deleted = 0 ORDER BY row").fetchall()
+        return [text for text, in rows]
+
+    def get_document_chunks(self, document_name: str) -> Dict[str, Dict]:
+        """
+        Get the content hash, the metadata and the embedding of every chunk of a document
+        :param document_name: the source of the document
+        :return: dictionary from chunk id to its content hash, metadata and embedding
+        """
+        with self.thread_lock:
+            self._refresh()
+            rows = self.connection.execute(
+                "SELECT row, id, metadata FROM chunks WHERE deleted = 0 AND source = ?", (document_name,)
+            ).fetchall()
+            chunks = {}
+            for row, chunk_id, metadata in rows:
+                metadata = json.loads(metadata)
+                chunks[chunk_id] = {
+                    "content_hash": metadata.get("content_hash"),
+                    "metadata": metadata,
+                    "embedding": self.matrix[row].tolist(),
+                }
+            return chunks
+
+    def delete_ids(self, ids: List[str]) -> None:
+        """
+        Delete chunks by id
+        """
+        self._delete("id", ids)
+
+    def delete_document(self, document_name: str) -> None:
+        """
+        Delete chunks from a certain document
+        """
+        self._delete("source", [document_name])
+
+    def get_all_documents(self) -> List[str]:
+        """
+        Get all unique document sources from the chunks
+        """
+        with self.thread_lock:
+            rows = self.connection.execute("SELECT DISTINCT source FROM chunks WHERE deleted = 0").fetchall()
+        return [source for source, in rows]
+
+    def _update_index(self, alive: np.ndarray):
+        """
+        Bring the HNSW index (labelled by row number) up to date: the appended rows are added and the
+        deleted rows are marked, it is only built from scratch after a compaction.
+        Must be called with the thread lock held
+        """
+        if self.index is None:
+            self.index = hnswlib.Index(space="ip", dim=self.dimension)
+            self.index.init_index(max_elements=max(len(alive), 1), ef_construction=200, M=16)
+            self.index_labels = np.zeros(0, dtype=bool)
+
+        # Mark the rows deleted since the last update
+        indexed_count = len(self.index_labels)
+        for row in np.flatnonzero(self.index_labels & ~alive[:indexed_count]):
+            self.index.mark_deleted(int(row))
+            self.index_labels[row] = False
+
+        # Add the rows appended since the last update
+        new_rows = np.flatnonzero(alive[indexed_count:]) + indexed_count
+        if len(new_rows):
+            needed = self.index.get_current_count() + len(new_rows)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            for start in range(0, len(new_rows), 10000):
+                rows = new_rows[start:start + 10000]
+                self.index.add_items(np.asarray(self.matrix[rows]), rows)
+        self.index_labels = np.concatenate([self.index_labels, np.zeros(len(alive) - indexed_count, dtype=bool)])
+        self.index_labels[new_rows] = True
+        return self.index
+
+    def _filtered_rows(self, filters: Dict[str, List]) -> np.ndarray:
+        """
+        Get the live rows whose metadata matches the filters, selected in SQLite before the search
+        """
+        conditions, parameters = ["deleted = 0"], []
+        for key, values in filters.items():
+            column = "source" if key == "source" else "json_extract(metadata, ?)"
+            if key != "source":
+                parameters.append('$."' + key.replace('"', '') + '"')
+            conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+            parameters.extend(values)
+        rows = self.connection.execute(f"SELECT row FROM chunks WHERE {' AND '.join(conditions)}", parameters)
+        return np.array([row for row, in rows], dtype=np.int64)
+
+    def _search_rows(self, query_vector: np.ndarray, k: int,
+                     filters: Optional[Dict[str, List]] = None) -> Tuple[List[int], Optional[str]]:
+        """
+        Get the rows of the k chunks most similar to the query
+        :return: the rows, and the layout of the store they refer to
+        """
+        with self.thread_lock:
+            # The rows are mapped and filtered from the same state of the store
+            with self._file_locked(fcntl.LOCK_SH):
+                self._refresh()
+                matrix, alive, layout = self.matrix, self.alive, self.loaded_layout
+                candidate_rows = self._filtered_rows(filters) if filters else None
+            if candidate_rows is not None:
+                candidate_rows = candidate_rows[candidate_rows < len(alive)]
+                candidate_rows = candidate_rows[alive[candidate_rows]]
+            alive_count = int(alive.sum()) if candidate_rows is None else len(candidate_rows)
+            k = min(k, alive_count)
+            if k == 0:
+                return [], layout
+
+            if candidate_rows is None and self.index_type == "hnsw" and alive_count >= self.index_min_size:
+                index = self._update_index(alive)
+            else:
+                index = None
+
+            if index is not None:
+                # hnswlib is not safe to query while it is being updated
+                index.set_ef(max(50, k))
+                labels, _ = index.knn_query(query_vector, k=k)
+                return [int(row) for row in labels[0]], layout
+
+        if candidate_rows is not None:
+            # Exact search over the matching rows only
+            scores = np.asarray(matrix[candidate_rows] @ query_vector[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            return [int(candidate_rows[index]) for index in top[np.argsort(-scores[top])]], layout
+
+        # Exact search, vectorized over the whole matrix
+        scores = np.asarray(matrix @ query_vector[0])
+        scores[~alive] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [int(row) for row in top[np.argsort(-scores[top])]], layout
+
+    def _resolve_rows(self, rows: List[int]) -> List[Document]:
+        """
+        Get the live chunks of the rows, must be called with the lock held
+        """
+        documents = {
+            row: Document(page_content=text, metadata=json.loads(metadata))
+            for row, text, metadata in self.connection.execute(
+                f"SELECT row, text, metadata FROM chunks WHERE deleted = 0 AND row IN ({','.join('?' * len(rows))})",
+                rows,
+            )
+        }
+        return [documents[row] for row in rows if row in documents]
+
+    def similarity_search_by_vector(self, embedding, k: int, filters: Optional[Dict[str, List]] = None,
+                                    max_attempts: int = 3) -> List[Document]:
+        """
+        Search the k most similar chunks to an embedding
+        """
+        query_vector = self._normalize(embedding)
+        for _ in range(max_attempts):
+            rows, layout = self._search_rows(query_vector, k, filters)
+            if not rows:
+                return []
+            # The rows are only valid if no compaction has renumbered them since the search
+            with self._shared_locked():
+                if self._get_meta("layout") == layout:
+                    return self._resolve_rows(rows)
+
+        # The store keeps being compacted, search while holding the lock
+        with self._shared_locked():
+            rows, _ = self._search_rows(query_vector, k, filters)
+            return self._resolve_rows(rows) if rows else []
+
+    def similarity_search(self, query: str, k: int, filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        """
+        Search the k most similar chunks to the query
+        :param query: the query text
+        :param k: number of chunks to return
+        :param filters: metadata filters (key -> accepted values), applied before the search
+        :return: list of matching documents
+        """
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, filters)
+
+    async def asimilarity_search(self, query: str, k: int,
+                                 filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        """
+        Asynchronously search the k most similar chunks to the query
+        :param query: the query text
+        :param k: number of chunks to return
+        :param filters: metadata filters (key -> accepted values), applied before the search
+        :return: list of matching documents
+        """
+        embedding = await self.embedding_function.aembed_query(query)
+        return await run_in_thread_pool(self.similarity_search_by_vector, embedding, k, filters)
+
+    async def asimilarity_search_by_vectors(self, embeddings: List, k: int,
+                                            filters: Optional[Dict[str, List]] = None) -> List[List[Document]]:
+        """
+        Asynchronously search the k most similar chunks to each embedding, in one thread pool call
+        :param embeddings: the embeddings of the queries
+        :param k: number of chunks to return per query
+        :param filters: metadata filters (key -> accepted values), applied before the search
+        :return: list of matching documents for each query
+        """
+        def search():
+            return [self.similarity_search_by_vector(embedding, k, filters) for embedding in embeddings]
+
+        return await run_in_thread_pool(search)
+
+    def as_retriever(self, search_kwargs: dict):
+        """
+        Converts the vector store into a retriever.
+
+        :param search_kwargs: Parameters for retrieval, such as number of results (`k`).
+        :return: A retriever object.
+        """
+        k = search_kwargs.get("k", 4)
+        return RunnableLambda(lambda query: self.similarity_search(query, k))
@@ -1,15 +1,30 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 from urllib.parse import urlparse
 
 import chromadb
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from module.vector_store.batch_embedder import BatchEmbedder
 
 
 class VectorStore(ABC):
     @abstractmethod
-    def add_multiple_documents(self, documents: List[Document]):
+    def add_multiple_documents(self, documents: List[Document],
+                               on_progress: Optional[Callable[[float], None]] = None):
+        pass
+
+    @abstractmethod
+    def upsert_multiple_documents(self, documents: List[Document], embeddings: Optional[List] = None,
+                                  on_progress: Optional[Callable[[float], None]] = None):
+        pass
+
+    @abstractmethod
+    def get_document_chunks(self, document_name: str) -> Dict[str, Dict]:
+        pass
+
+    @abstractmethod
+    def delete_ids(self, ids: List[str]) -> None:
         pass
 
     @abstractmethod
@@ -20,42 +35,77 @@ class VectorStore(ABC):
     def get_all_documents(self) -> List[str]:
         pass
 
+    @abstractmethod
+    def get_vector_store_documents(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def get_vector_store_metadata(self) -> List:
+        pass
+
+    @abstractmethod
+    def similarity_search(self, query: str, k: int, filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        pass
+
+    @abstractmethod
+    async def asimilarity_search(self, query: str, k: int,
+                                 filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        pass
+
+    @abstractmethod
+    async def asimilarity_search_by_vectors(self, embeddings: List, k: int,
+                                            filters: Optional[Dict[str, List]] = None) -> List[List[Document]]:
+        pass
+
+    @abstractmethod
+    def as_retriever(self, search_kwargs: dict):
+        pass
+
 
 class ChromaClientVectorStore(VectorStore, ABC):
-    def __init__(self, url: str, embedding_function):
+    def __init__(self, url: str, embedding_function, batch_embedder: Optional[BatchEmbedder] = None,
+                 collection_name: str = "chroma_vector_store"):
         """
         Create a Chroma-based vector store
         :param url: url of the Chroma server
         :param embedding_function: embedding function to use for the vector store
+        :param batch_embedder: optional embedder used to add documents in concurrent batches
+        :param collection_name: name of the Chroma collection, one per tenant
         """
         parsed_url = urlparse(url)
         self.host = parsed_url.hostname
         self.port = parsed_url.port
         self.client = chromadb.HttpClient(self.host, self.port)
         self.embedding_function = embedding_function
+        self.batch_embedder = batch_embedder
+        self.collection_name = collection_name
+
+        # The async client is created on first use, inside the running event loop
+        self.async_collection = None
 
-        # Create or get a collection. You might want to make the collection name configurable
+        # Create or get a collection
         self.collection = self.client.get_or_create_collection(
-            name="chroma_vector_store", embedding_function=embedding_function
+            name=self.collection_name, embedding_function=embedding_function
         )
 
     def get_vector_store_metadata(self) -> List:
         """
         Get the metadata of the vector store
         """
-        result = self.collection.get()
+        result = self.collection.get(include=["metadatas"])
         return result["metadatas"]
 
     def get_vector_store_documents(self) -> List[str]:
         """
         Get the documents from the vector store
         """
-        result = self.collection.get()
+        result = self.collection.get(include=["documents"])
         return result["documents"]
 
-    def add_multiple_documents(self, documents: List[Document]):
+    def _write_documents(self, write, documents: List[Document], embeddings: Optional[List] = None,
+                         on_progress: Optional[Callable[[float], None]] = None):
         """
-        Add multiple documents to the vector store
+        Write documents with the given collection method (add or upsert)
         """
         # Assuming Document class has text, metadata, and some sort of ID
         ids = [
@@ -66,13 +116,79 @@ class ChromaClientVectorStore(VectorStore, ABC):
         ]  # Assuming page_content holds the text
         metadatas = [doc.metadata for doc in documents]
 
-        self.collection.add(documents=texts, metadatas=metadatas, ids=ids)
+        if embeddings is not None:
+            write(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            return
+
+        if self.batch_embedder is None:
+            write(documents=texts, metadatas=metadatas, ids=ids)
+            return
+
+        # Write each batch to Chroma as soon as its embeddings are ready
+        written_ids = []
+        try:
+            for batch, batch_embeddings in self.batch_embedder.embed_batches(texts, on_progress):
+                batch_ids = [ids[index] for index in batch]
+                write(
+                    ids=batch_ids,
+                    embeddings=batch_embeddings,
+                    documents=[texts[index] for index in batch],
+                    metadatas=[metadatas[index] for index in batch],
+                )
+                written_ids.extend(batch_ids)
+        except Exception:
+            # Do not leave the document half written, the failed ingestion can be retried from scratch
+            self.delete_ids(written_ids)
+            raise
+
+    def add_multiple_documents(self, documents: List[Document],
+                               on_progress: Optional[Callable[[float], None]] = None):
+        """
+        Add multiple documents to the vector store
+        :param documents: the chunks to write
+        :param on_progress: called with the fraction of the chunks embedded so far, with a batch embedder
+        """
+        self._write_documents(self.collection.add, documents, on_progress=on_progress)
+
+    def upsert_multiple_documents(self, documents: List[Document], embeddings: Optional[List] = None,
+                                  on_progress: Optional[Callable[[float], None]] = None):
+        """
+        Add or replace multiple documents in the vector store
+        :param documents: the chunks to write
+        :param embeddings: embeddings of the chunks, they are computed if None
+        :param on_progress: called with the fraction of the chunks embedded so far, with a batch embedder
+        """
+        if documents:
+            self._write_documents(self.collection.upsert, documents, embeddings, on_progress)
+
+    def get_document_chunks(self, document_name: str) -> Dict[str, Dict]:
+        """
+        Get the content hash, the metadata and the embedding of every chunk of a document
+        :param document_name: the source of the document
+        :return: dictionary from chunk id to its content hash, metadata and embedding
+        """
+        result = self.collection.get(where={"source": document_name}, include=["metadatas", "embeddings"])
+        return {
+            chunk_id: {
+                "content_hash": (metadata or {}).get("content_hash"),
+                "metadata": metadata or {},
+                "embedding": [float(value) for value in embedding],
+            }
+            for chunk_id, metadata, embedding in zip(result["ids"], result["metadatas"], result["embeddings"])
+        }
+
+    def delete_ids(self, ids: List[str]) -> None:
+        """
+        Delete chunks by id in a single request
+        """
+        if ids:
+            self.collection.delete(ids=ids)
 
     def _get_matching_document_ids(self, document_name: str) -> List[str]:
         """
         Get all the chunks id that comes from the document
         """
-        result = self.collection.get(where={"source": document_name})
+        result = self.collection.get(where={"source": document_name}, include=[])
         return result["ids"]
 
     def delete_document(self, document_name: str) -> None:
@@ -86,7 +202,7 @@ class ChromaClientVectorStore(VectorStore, ABC):
         """
         Get all unique document sources from the chunks
         """
-        result = self.collection.get()
+        result = self.collection.get(include=["metadatas"])
         return list(
             set(
                 metadata["source"]
@@ -95,6 +211,77 @@ class ChromaClientVectorStore(VectorStore, ABC):
             )
         )
 
+    async def _get_async_collection(self):
+        """
+        Get the collection through the async Chroma client
+        """
+        if self.async_collection is None:
+            async_client = await chromadb.AsyncHttpClient(host=self.host, port=self.port)
+            self.async_collection = await async_client.get_or_create_collection(
+                name=self.collection_name
+            )
+        return self.async_collection
+
+    @staticmethod
+    def _to_where(filters: Optional[Dict[str, List]]) -> Optional[Dict[str, Any]]:
+        """
+        Convert the metadata filters (key -> accepted values) to a Chroma where clause
+        """
+        if not filters:
+            return None
+        clauses = [{key: {"$in": values}} for key, values in filters.items()]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def similarity_search(self, query: str, k: int, filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        """
+        Search the k most similar chunks to the query
+        :param query: the query text
+        :param k: number of chunks to return
+        :param filters: metadata filters (key -> accepted values), applied by Chroma before the search
+        :return: list of matching documents
+        """
+        embedding = self.embedding_function.embed_query(query)
+        result = self.collection.query(query_embeddings=[embedding], n_results=k, where=self._to_where(filters))
+        return [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(result["documents"][0], result["metadatas"][0])
+        ]
+
+    async def asimilarity_search(self, query: str, k: int,
+                                 filters: Optional[Dict[str, List]] = None) -> List[Document]:
+        """
+        Asynchronously search the k most similar chunks to the query
+        :param query: the query text
+        :param k: number of chunks to return
+        :param filters: metadata filters (key -> accepted values), applied by Chroma before the search
+        :return: list of matching documents
+        """
+        embedding = await self.embedding_function.aembed_query(query)
+        collection = await self._get_async_collection()
+        result = await collection.query(query_embeddings=[embedding], n_results=k, where=self._to_where(filters))
+        return [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(result["documents"][0], result["metadatas"][0])
+        ]
+
+    async def asimilarity_search_by_vectors(self, embeddings: List, k: int,
+                                            filters: Optional[Dict[str, List]] = None) -> List[List[Document]]:
+        """
+        Asynchronously search the k most similar chunks to each embedding, in a single Chroma query
+        :param embeddings: the embeddings of the queries
+        :param k: number of chunks to return per query
+        :param filters: metadata filters (key -> accepted values), applied by Chroma before the search
+        :return: list of matching documents for each query
+        """
+        if not embeddings:
+            return []
+        collection = await self._get_async_collection()
+        result = await collection.query(query_embeddings=embeddings, n_results=k, where=self._to_where(filters))
+        return [
+            [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+            for texts, metadatas in zip(result["documents"], result["metadatas"])
+        ]
+
     def as_retriever(self, search_kwargs: dict):
         """
         Converts the vector store into a retriever.
@@ -104,6 +291,6 @@ class ChromaClientVectorStore(VectorStore, ABC):
         """
         return Chroma(
             client=self.client,
-            collection_name="chroma_vector_store",
+            collection_name=self.collection_name,
             embedding_function=self.embedding_function
         ).as_retriever(search_kwargs=search_kwargs)
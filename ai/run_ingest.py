@@ -0,0 +1,38 @@
+import argparse
+import os
+
+from configs.config import (CONVERTER, DEFAULT_TENANT, IMAGE_FOLDER,
+                            INGEST_CHECKPOINT_PATH, MARKDOWN_FOLDER,
+                            PDF_FOLDER)
+from module.pipeline import get_data_pipeline
+from module.pipeline.bulk_ingest import bulk_ingest
+from module.pipeline.tenants import (get_tenant_folder, get_tenant_path,
+                                     validate_tenant_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and ingest a folder of PDFs")
+    parser.add_argument("--tenant", type=str, default=DEFAULT_TENANT)
+    parser.add_argument("--input", type=str, default=None)
+    parser.add_argument("--converter", type=str, default=CONVERTER)
+    parser.add_argument("--convert-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--ingest-workers", type=int, default=4)
+    parser.add_argument("--checkpoint", type=str, default=None)
+    args = parser.parse_args()
+    tenant_id = validate_tenant_id(args.tenant)
+
+    # The files of the tenant are in its own folders
+    markdown_folder = get_tenant_folder(MARKDOWN_FOLDER, tenant_id)
+    image_folder = get_tenant_folder(IMAGE_FOLDER, tenant_id)
+    os.makedirs(markdown_folder, exist_ok=True)
+    os.makedirs(image_folder, exist_ok=True)
+
+    bulk_ingest(
+        pdf_folder=args.input or get_tenant_folder(PDF_FOLDER, tenant_id),
+        markdown_folder=markdown_folder,
+        image_folder=image_folder,
+        converter_name=args.converter,
+        data_pipeline=get_data_pipeline(tenant_id),
+        checkpoint_path=args.checkpoint or get_tenant_path(INGEST_CHECKPOINT_PATH, tenant_id),
+        convert_workers=args.convert_workers,
+        ingest_workers=args.ingest_workers,
+    )
@@ -0,0 +1,26 @@
+import argparse
+
+from configs.config import (CONVERT_LARGE_QUEUE, CONVERT_QUEUE,
+                            CONVERT_WORKERS, CONVERTER,
+                            LLAMA_PARSE_MAX_WORKERS, MINERU_MAX_WORKERS,
+                            WORKER_SHUTDOWN_TIMEOUT)
+from server.workers.supervisor import (WorkerSupervisor, default_worker_count,
+                                       plan_workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start and supervise the conversion workers")
+    parser.add_argument("--workers", type=int, default=CONVERT_WORKERS,
+                        help="number of workers, 0 to size it from the CPU count and the converter")
+    parser.add_argument("--max-jobs", type=int, default=None,
+                        help="restart each worker after this many jobs, to release its memory")
+    parser.add_argument("--shutdown-timeout", type=float, default=WORKER_SHUTDOWN_TIMEOUT)
+    args = parser.parse_args()
+
+    total_workers = args.workers or default_worker_count(CONVERTER, LLAMA_PARSE_MAX_WORKERS, MINERU_MAX_WORKERS)
+    worker_args = ["--max-jobs", str(args.max_jobs)] if args.max_jobs else []
+    supervisor = WorkerSupervisor(
+        plan_workers(total_workers, CONVERT_QUEUE, CONVERT_LARGE_QUEUE),
+        shutdown_timeout=args.shutdown_timeout,
+        worker_args=worker_args,
+    )
+    supervisor.run()
@@ -1,11 +1,27 @@
-import os
+from redis import Redis
+from rq import SimpleWorker, Worker
 
-from configs.config import REDIS_URL
+from configs.config import CONVERT_LARGE_QUEUE, CONVERT_QUEUE, REDIS_URL
 import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--name", type=str, default="default")
+    parser.add_argument("--name", type=str, default="default",
+                        help="comma-separated queues, in priority order")
+    parser.add_argument("--max-jobs", type=int, default=None,
+                        help="exit after this many jobs, to release the memory of the worker")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="do not load the converter and its models before the first job")
+    parser.add_argument("--fork", action="store_true",
+                        help="run each job in a forked process (models are then reloaded per job)")
     args = parser.parse_args()
+    queues = args.name.split(",")
 
-    os.system(f"rq worker --url {REDIS_URL} {args.name}")
+    # Keep the converter and its models resident, jobs run in this process
+    if {CONVERT_QUEUE, CONVERT_LARGE_QUEUE} & set(queues) and not args.no_preload:
+        from server.workers.convert import preload
+        preload()
+
+    worker_class = Worker if args.fork else SimpleWorker
+    worker = worker_class(queues, connection=Redis.from_url(REDIS_URL))
+    worker.work(max_jobs=args.max_jobs)
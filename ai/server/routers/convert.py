@@ -1,15 +1,33 @@
 import os
 import uuid
+from typing import List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from redis import Redis
 from rq import Queue
-from configs.config import REDIS_URL
+from configs.config import (CONVERT_LARGE_FILE_SIZE, CONVERT_LARGE_QUEUE,
+                            CONVERT_QUEUE, REDIS_URL, UPLOAD_FOLDER)
+from module.pipeline.tenants import get_tenant_folder
+from server.routers.tenant import get_tenant_id
 from server.services.convert import convert_service
+from server.services.job import job_service
+from server.workers.progress import initial_meta
 
 router = APIRouter()
-convert_queue = Queue("convert", connection=Redis.from_url(REDIS_URL))
+redis_connection = Redis.from_url(REDIS_URL)
+convert_queue = Queue(CONVERT_QUEUE, connection=redis_connection)
+convert_large_queue = Queue(CONVERT_LARGE_QUEUE, connection=redis_connection)
+
+
+def get_convert_queue(name: str, tenant_id: str) -> Queue:
+    """
+    Get the queue of a file, large files have their own queue so they do not hold up the small ones
+    """
+    file_path = os.path.join(get_tenant_folder(UPLOAD_FOLDER, tenant_id), name)
+    if os.path.exists(file_path) and os.path.getsize(file_path) > CONVERT_LARGE_FILE_SIZE:
+        return convert_large_queue
+    return convert_queue
 
 
 class ConvertPath(BaseModel):
@@ -20,35 +38,55 @@ class Response(BaseModel):
     message: str
 
 
+class JobIds(BaseModel):
+    job_ids: List[str]
+
+
 @router.post("/convert", response_model=Response)
-async def convert_rag(query: ConvertPath):
+async def convert_rag(query: ConvertPath, tenant_id: str = Depends(get_tenant_id)):
     convert_job_id = f"convert-{uuid.uuid4()}"
-    convert_queue.enqueue(
+    get_convert_queue(query.name, tenant_id).enqueue(
         "server.workers.convert.convert_file",
-        args=(query.name, convert_job_id),
+        args=(query.name, convert_job_id, tenant_id),
         job_id=convert_job_id,
+        meta=initial_meta(query.name),
     )
     return Response(message=convert_job_id)
 
 
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    return job_service.get_status(job_id)
+
+
+@router.post("/jobs/status")
+async def get_job_statuses(query: JobIds):
+    return {"jobs": job_service.get_statuses(query.job_ids)}
+
+
 @router.delete("/delete_document/{name}")
-async def delete_document(name: str):
-    convert_service.remove_document(name + ".md")
+async def delete_document(name: str, tenant_id: str = Depends(get_tenant_id)):
+    convert_service.remove_document(name + ".md", tenant_id)
     return Response(message="Document deleted")
 
 
 @router.get("/get_uploaded_documents")
-async def get_documents():
-    documents = os.listdir("data/pdfs")
-    documents = [doc.replace(".pdf", "") for doc in documents if doc.endswith(".pdf")]
-    processed_documents = convert_service.get_all_documents()
+async def get_documents(tenant_id: str = Depends(get_tenant_id)):
+    documents = convert_service.get_pdf_documents(tenant_id)
+    documents = [doc.replace(".pdf", "") for doc in documents]
+    processed_documents = convert_service.get_all_documents(tenant_id)
     processed_documents = [doc.replace(".md", "") for doc in processed_documents]
     documents = list(set(documents) - set(processed_documents))
     return {"documents": documents}
 
 
 @router.get("/get_rag_documents")
-async def get_rag_documents():
-    documents = convert_service.get_all_documents()
+async def get_rag_documents(tenant_id: str = Depends(get_tenant_id)):
+    documents = convert_service.get_all_documents(tenant_id)
     documents = [doc.replace(".md", "") for doc in documents]
     return {"documents": documents}
+
+
+@router.get("/get_document_catalog")
+async def get_document_catalog(tenant_id: str = Depends(get_tenant_id)):
+    return {"documents": convert_service.get_document_catalog(tenant_id)}
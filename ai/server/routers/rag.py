@@ -1,5 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from configs.config import QUERY_BATCH_CONCURRENCY, QUERY_BATCH_MAX_SIZE
+from server.routers.tenant import get_tenant_id
 from server.services.rag import rag_service
 
 router = APIRouter()
@@ -8,6 +14,25 @@ router = APIRouter()
 class Query(BaseModel):
     text: str
     model: str
+    # Scope of the retrieval: names of the documents, and filters on the chunk metadata (key -> value or values)
+    documents: Optional[List[str]] = None
+    filters: Optional[Dict[str, Any]] = None
+
+
+class BatchQuery(BaseModel):
+    questions: List[str] = Field(..., max_length=QUERY_BATCH_MAX_SIZE)
+    model: str
+    documents: Optional[List[str]] = None
+    filters: Optional[Dict[str, Any]] = None
+    # Maximum number of LLM calls at the same time, capped by the server
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
+
+def get_filters(documents, filters):
+    try:
+        return rag_service.get_filters(documents, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 class Response(BaseModel):
@@ -18,9 +43,10 @@ class Response(BaseModel):
     keyword_metadata: str
 
 @router.post("/query", response_model=Response)
-async def query_rag(query: Query):
+async def query_rag(query: Query, tenant_id: str = Depends(get_tenant_id)):
+    filters = get_filters(query.documents, query.filters)
     try:
-        answer = rag_service.invoke(query.text, query.model)
+        answer = await rag_service.ainvoke(query.text, query.model, filters, tenant_id)
         return Response(
             answer=answer.answer,
             semantic_context=answer.semantic_context,
@@ -30,3 +56,45 @@ async def query_rag(query: Query):
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/query_stream")
+async def query_rag_stream(query: Query, tenant_id: str = Depends(get_tenant_id)):
+    filters = get_filters(query.documents, query.filters)
+
+    async def generate():
+        # Each event is sent as one JSON line (NDJSON)
+        try:
+            async for event in rag_service.astream(query.text, query.model, filters, tenant_id):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.post("/query_batch")
+async def query_rag_batch(query: BatchQuery, tenant_id: str = Depends(get_tenant_id)):
+    filters = get_filters(query.documents, query.filters)
+    max_concurrency = min(query.max_concurrency or QUERY_BATCH_CONCURRENCY, QUERY_BATCH_CONCURRENCY)
+
+    async def generate():
+        # Each answer is sent as one JSON line (NDJSON) as soon as it is ready, with the index of its question
+        try:
+            async for index, answer in rag_service.abatch(
+                query.questions, query.model, filters, max_concurrency, tenant_id
+            ):
+                if isinstance(answer, Exception):
+                    yield json.dumps({"type": "error", "index": index, "detail": str(answer)}) + "\n"
+                else:
+                    yield json.dumps({"type": "answer", "index": index, **answer.to_dict()}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+        yield json.dumps({"type": "done"}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/metrics")
+async def get_metrics(tenant_id: str = Depends(get_tenant_id)):
+    return rag_service.get_metrics(tenant_id)
@@ -0,0 +1,13 @@
+from fastapi import Header, HTTPException
+from configs.config import DEFAULT_TENANT
+from module.pipeline.tenants import validate_tenant_id
+
+
+def get_tenant_id(x_tenant_id: str = Header(DEFAULT_TENANT)) -> str:
+    """
+    Get the tenant of the request from the X-Tenant-Id header set by the backend
+    """
+    try:
+        return validate_tenant_id(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -3,8 +3,10 @@ import shutil
 
 from module.markdown_converter import Converter
 from module.markdown_converter.utils import convert_file
-from module.pipeline import data_pipeline
+from module.pipeline import DataPipeline, get_data_pipeline
+from module.pipeline.tenants import get_tenant_folder
 from configs.config import (
+    DEFAULT_TENANT,
     IMAGE_FOLDER,
     MARKDOWN_FOLDER,
     PDF_FOLDER,
@@ -15,12 +17,40 @@ from configs.config import (
 
 class ConvertService:
     def __init__(self):
-        self.data_pipeline = data_pipeline
+        # The converter is created once per process and reused by every job
+        self.converter = None
 
-    def get_file(self, file_name):
-        source_path = os.path.join(UPLOAD_FOLDER, file_name)
-        destination_path = os.path.join(PDF_FOLDER, file_name)
-        shutil.move(source_path, destination_path)
+    def get_converter(self):
+        if self.converter is None:
+            self.converter = Converter.get_converter(CONVERTER)(IMAGE_FOLDER)
+        return self.converter
+
+    def preload(self):
+        """
+        Create and warm up the converter and the data pipeline before the first job
+        """
+        self.get_converter().warm_up()
+        get_data_pipeline()
+
+    def data_pipeline(self, tenant_id: str = DEFAULT_TENANT) -> DataPipeline:
+        # The pipeline of the tenant is built on first use, without the LLMs and retrievers
+        return get_data_pipeline(tenant_id)
+
+    @staticmethod
+    def get_folder(folder: str, tenant_id: str = DEFAULT_TENANT) -> str:
+        # Each tenant has its own files, the default tenant keeps the base folders
+        tenant_folder = get_tenant_folder(folder, tenant_id)
+        os.makedirs(tenant_folder, exist_ok=True)
+        return tenant_folder
+
+    def get_file(self, file_name, tenant_id=DEFAULT_TENANT):
+        source_path = os.path.join(self.get_folder(UPLOAD_FOLDER, tenant_id), file_name)
+        destination_path = os.path.join(self.get_folder(PDF_FOLDER, tenant_id), file_name)
+        # A rename when both folders are on the same file system, so the file is not copied again
+        try:
+            os.replace(source_path, destination_path)
+        except OSError:
+            shutil.move(source_path, destination_path)
 
     def convert_file_params_validation(
         self, input_path, output_path, image_output_path
@@ -33,29 +63,41 @@ class ConvertService:
             raise ValueError(f"Image output path {image_output_path} does not exist")
         return True
 
-    def convert_file(self, name):
-        self.get_file(name)
-        converter = Converter.get_converter(CONVERTER)
+    def convert_file(self, name, tenant_id=DEFAULT_TENANT):
+        self.get_file(name, tenant_id)
         convert_file(
-            input_path=os.path.join(PDF_FOLDER, name),
-            output_path=os.path.join(MARKDOWN_FOLDER),
-            file_converter=converter(IMAGE_FOLDER),
+            input_path=os.path.join(self.get_folder(PDF_FOLDER, tenant_id), name),
+            output_path=self.get_folder(MARKDOWN_FOLDER, tenant_id),
+            file_converter=self.get_converter(),
+            image_folder=self.get_folder(IMAGE_FOLDER, tenant_id),
         )
 
-    def add_document(self, name):
-        self.data_pipeline.add_single_document(os.path.join(MARKDOWN_FOLDER, name))
+    def add_document(self, name, on_stage=None, tenant_id=DEFAULT_TENANT, on_progress=None):
+        self.data_pipeline(tenant_id).add_single_document(
+            os.path.join(self.get_folder(MARKDOWN_FOLDER, tenant_id), name), on_stage=on_stage,
+            on_progress=on_progress
+        )
+
+    def remove_document(self, name, tenant_id=DEFAULT_TENANT):
+        markdown_folder = self.get_folder(MARKDOWN_FOLDER, tenant_id)
+        image_folder = self.get_folder(IMAGE_FOLDER, tenant_id)
+        pdf_folder = self.get_folder(PDF_FOLDER, tenant_id)
+        self.data_pipeline(tenant_id).remove_single_document(name)
+        if os.path.exists(os.path.join(markdown_folder, name)):
+            os.remove(os.path.join(markdown_folder, name))
+        if os.path.exists(os.path.join(image_folder, name.replace(".md", ""))):
+            shutil.rmtree(os.path.join(image_folder, name.replace(".md", "")))
+        if os.path.exists(os.path.join(pdf_folder, name.replace(".md", ".pdf"))):
+            os.remove(os.path.join(pdf_folder, name.replace(".md", ".pdf")))
+
+    def get_pdf_documents(self, tenant_id=DEFAULT_TENANT):
+        return [doc for doc in os.listdir(self.get_folder(PDF_FOLDER, tenant_id)) if doc.endswith(".pdf")]
 
-    def remove_document(self, name):
-        self.data_pipeline.remove_single_document(name)
-        if os.path.exists(os.path.join(MARKDOWN_FOLDER, name)):
-            os.remove(os.path.join(MARKDOWN_FOLDER, name))
-        if os.path.exists(os.path.join(IMAGE_FOLDER, name.replace(".md", ""))):
-            shutil.rmtree(os.path.join(IMAGE_FOLDER, name.replace(".md", "")))
-        if os.path.exists(os.path.join(PDF_FOLDER, name.replace(".md", ".pdf"))):
-            os.remove(os.path.join(PDF_FOLDER, name.replace(".md", ".pdf")))
+    def get_all_documents(self, tenant_id=DEFAULT_TENANT):
+        return self.data_pipeline(tenant_id).get_all_documents()
 
-    def get_all_documents(self):
-        return self.data_pipeline.get_all_documents()
+    def get_document_catalog(self, tenant_id=DEFAULT_TENANT):
+        return self.data_pipeline(tenant_id).get_document_catalog()
 
 
 convert_service = ConvertService()
@@ -0,0 +1,62 @@
+import time
+from typing import List, Optional
+
+from redis import Redis
+from rq.job import Job, JobStatus
+from configs.config import REDIS_URL
+
+
+class JobService:
+    def __init__(self, connection: Redis):
+        self.connection = connection
+
+    @staticmethod
+    def get_job_status(job_id: str, job: Optional[Job]) -> dict:
+        """
+        Get the status of a job from its RQ status and the metadata reported by the worker
+        :param job_id: id of the job
+        :param job: the job, None if it does not exist (or has expired)
+        """
+        if job is None:
+            return {"job_id": job_id, "stage": "not_found", "progress": 0}
+
+        meta = job.meta
+        status = job.get_status(refresh=False)
+        stage = meta.get("stage", "queued")
+        error = meta.get("error")
+
+        # The job failed without the worker reporting it (killed worker, timeout)
+        if status in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED) and stage != "failed":
+            stage = "failed"
+            error = error or job.exc_info or f"Job {status}"
+        elif status == JobStatus.FINISHED:
+            stage = "done"
+
+        now = time.time()
+        return {
+            "job_id": job_id,
+            "name": meta.get("name"),
+            "status": str(status),
+            "stage": stage,
+            "progress": 100 if stage in ("done", "failed") else meta.get("progress", 0),
+            "timings": meta.get("timings", {}),
+            "error": error,
+            # Time since the worker last reported progress, to tell a slow job from a dead one
+            "seconds_since_update": round(now - meta["updated_at"], 3) if "updated_at" in meta else None,
+            "last_heartbeat": job.last_heartbeat.isoformat() if job.last_heartbeat else None,
+            "enqueued_at": job.enqueued_at.isoformat() if job.enqueued_at else None,
+            "ended_at": job.ended_at.isoformat() if job.ended_at else None,
+        }
+
+    def get_status(self, job_id: str) -> dict:
+        return self.get_statuses([job_id])[0]
+
+    def get_statuses(self, job_ids: List[str]) -> List[dict]:
+        """
+        Get the status of many jobs, fetched from Redis in one round trip
+        """
+        jobs = Job.fetch_many(job_ids, connection=self.connection)
+        return [self.get_job_status(job_id, job) for job_id, job in zip(job_ids, jobs)]
+
+
+job_service = JobService(Redis.from_url(REDIS_URL))
@@ -1,12 +1,45 @@
-from module.pipeline import RAGPipeline, rag_pipeline
+from configs.config import DEFAULT_TENANT
+from module.document_retriever import normalize_filters
+from module.pipeline import RAGPipeline, get_embedding_cache, get_rag_pipeline, tenants
 
 
 class RAGService:
-    def __init__(self, rag_pipeline: RAGPipeline):
-        self.rag_pipeline = rag_pipeline
+    @staticmethod
+    def rag_pipeline(tenant_id: str = DEFAULT_TENANT) -> RAGPipeline:
+        # The pipeline of the tenant is built on first use
+        return get_rag_pipeline(tenant_id)
 
-    def invoke(self, text: str, model: str):
-        return self.rag_pipeline.invoke(text, model)
+    @staticmethod
+    def get_filters(documents=None, filters=None):
+        """
+        Merge the documents (names as listed by the API) into the metadata filters
+        :raise ValueError: if the documents or a filter are an empty list
+        """
+        filters = dict(filters or {})
+        if documents is not None:
+            if not documents:
+                raise ValueError("The list of documents is empty")
+            filters["source"] = [f"{name}.md" for name in documents]
+        return normalize_filters(filters)
 
+    def invoke(self, text: str, model: str, filters=None, tenant_id: str = DEFAULT_TENANT):
+        return self.rag_pipeline(tenant_id).invoke(text, model, filters)
 
-rag_service = RAGService(rag_pipeline)
+    async def ainvoke(self, text: str, model: str, filters=None, tenant_id: str = DEFAULT_TENANT):
+        return await self.rag_pipeline(tenant_id).ainvoke(text, model, filters)
+
+    def astream(self, text: str, model: str, filters=None, tenant_id: str = DEFAULT_TENANT):
+        return self.rag_pipeline(tenant_id).astream(text, model, filters)
+
+    def abatch(self, questions, model: str, filters=None, max_concurrency=None, tenant_id: str = DEFAULT_TENANT):
+        return self.rag_pipeline(tenant_id).abatch(questions, model, filters, max_concurrency)
+
+    def get_metrics(self, tenant_id: str = DEFAULT_TENANT):
+        metrics = {"embedding_cache": get_embedding_cache().stats(), "loaded_tenants": tenants.keys()}
+        answer_cache = self.rag_pipeline(tenant_id).answer_cache
+        if answer_cache is not None:
+            metrics["answer_cache"] = answer_cache.stats()
+        return metrics
+
+
+rag_service = RAGService()
@@ -1,13 +1,53 @@
-from httpx import Client
-from configs.config import BACKEND_SERVER_URL
+from typing import Optional
+
+from httpx import Client, HTTPTransport, Limits, Timeout
+from loguru import logger
+from rq import get_current_job
+from configs.config import BACKEND_SERVER_URL, DEFAULT_TENANT, HTTP_RETRIES, HTTP_TIMEOUT
 from server.services.convert import convert_service
+from server.workers.progress import JobProgress
+
+# Client reused by every job of the worker, so the connection to the backend is kept alive
+backend_client: Optional[Client] = None
+
+
+def get_backend_client() -> Client:
+    global backend_client
+    if backend_client is None:
+        backend_client = Client(
+            base_url=BACKEND_SERVER_URL,
+            transport=HTTPTransport(retries=HTTP_RETRIES, limits=Limits(max_keepalive_connections=1)),
+            timeout=Timeout(HTTP_TIMEOUT, connect=5),
+        )
+    return backend_client
+
+
+def preload():
+    convert_service.preload()
+    get_backend_client()
 
 
-def convert_file(name, job_id):
-    convert_service.convert_file(name)
-    convert_service.add_document(name.replace(".pdf", ".md"))
-    client = Client()
-    client.post(f"{BACKEND_SERVER_URL}/api/response_convert", json={"job_id": job_id})
+def convert_file(name, job_id, tenant_id=DEFAULT_TENANT):
+    progress = JobProgress(get_current_job())
+    try:
+        progress.stage("converting")
+        convert_service.convert_file(name, tenant_id)
+        convert_service.add_document(name.replace(".pdf", ".md"), on_stage=progress.stage, tenant_id=tenant_id,
+                                     on_progress=progress.embedding)
+        # The job is only done once the backend knows about the file
+        get_backend_client().post("/api/response_convert", json={"job_id": job_id}).raise_for_status()
+        progress.stage("done")
+    except Exception as e:
+        progress.fail(e)
+        # Let the backend forget the file, so it can be uploaded again
+        try:
+            get_backend_client().post(
+                "/api/response_convert", json={"job_id": job_id, "status": "failed"}
+            ).raise_for_status()
+        except Exception as notify_error:
+            logger.warning(f"Failed to notify the backend that job {job_id} ({name}, tenant {tenant_id}) "
+                           f"failed: {type(notify_error).__name__}: {notify_error}")
+        raise
 
 if __name__ == "__main__":
     convert_file("paper.pdf", "convert-95e3aee3-a560-4295-8cda-b867b212893t")
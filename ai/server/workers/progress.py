@@ -0,0 +1,78 @@
+import time
+from typing import Optional
+
+from rq.job import Job
+
+# Stages of a conversion job, with the progress (percent) reached when the stage starts
+STAGE_PROGRESS = {
+    "queued": 0,
+    "converting": 5,
+    "segmenting": 60,
+    "embedding": 70,
+    "done": 100,
+    "failed": 100,
+}
+
+
+def initial_meta(name: str) -> dict:
+    """
+    Get the metadata of a job that has just been enqueued
+    :param name: name of the converted file
+    """
+    now = time.time()
+    return {
+        "name": name,
+        "stage": "queued",
+        "progress": STAGE_PROGRESS["queued"],
+        "timings": {},
+        "error": None,
+        "stage_started_at": now,
+        "updated_at": now,
+    }
+
+
+class JobProgress:
+    def __init__(self, job: Optional[Job]):
+        """
+        Report the stage, progress and per-stage timings of a job in its RQ metadata
+        :param job: the current job, None when running outside of a worker (nothing is reported)
+        """
+        self.job = job
+
+    def _save(self, **values):
+        if self.job is None:
+            return
+        meta = self.job.meta
+        now = time.time()
+
+        # Close the timing of the current stage
+        stage = meta.get("stage")
+        if stage is not None and "stage" in values:
+            started_at = meta.get("stage_started_at", now)
+            meta.setdefault("timings", {})[stage] = round(now - started_at, 3)
+            meta["stage_started_at"] = now
+
+        meta.update(values)
+        meta["updated_at"] = now
+        self.job.save_meta()
+
+    def stage(self, stage: str):
+        """
+        Start a new stage of the job
+        :param stage: one of STAGE_PROGRESS
+        """
+        self._save(stage=stage, progress=STAGE_PROGRESS[stage])
+
+    def embedding(self, fraction: float):
+        """
+        Report the progress of the embedding stage, between its start and the end of the job
+        :param fraction: fraction of the chunks embedded so far
+        """
+        start, end = STAGE_PROGRESS["embedding"], STAGE_PROGRESS["done"]
+        self._save(progress=round(start + (end - start) * min(fraction, 1.0), 1))
+
+    def fail(self, error: Exception):
+        """
+        Record the error that stopped the job
+        """
+        self._save(stage="failed", progress=STAGE_PROGRESS["failed"], error=f"{type(error).__name__}: {error}")
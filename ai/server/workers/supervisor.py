@@ -0,0 +1,140 @@
+"""
+Author: Trang Anh Thuan & Son Phat Tran
+This file contains the supervisor starting and restarting the conversion workers
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# Script started for each worker
+WORKER_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../run_worker.py"))
+
+
+def default_worker_count(converter_name: str, llama_parse_max_workers: int, mineru_max_workers: int) -> int:
+    """
+    Get the number of conversion workers from the CPU count, capped per converter
+    :param converter_name: name of the PDF converter
+    :param llama_parse_max_workers: maximum number of workers calling the LlamaParse API
+    :param mineru_max_workers: maximum number of workers running MinerU locally
+    """
+    cpu_count = os.cpu_count() or 1
+    if converter_name == "miner_u":
+        # Each MinerU worker keeps its models in memory and uses several cores
+        return max(1, min(mineru_max_workers, cpu_count // 4))
+    # LlamaParse workers mostly wait on the cloud API
+    return max(1, min(llama_parse_max_workers, cpu_count * 2))
+
+
+def plan_workers(total_workers: int, small_queue: str, large_queue: str) -> List[List[str]]:
+    """
+    Split the workers between the queues. Most workers only take small documents so a large
+    document never holds up the small ones, the others take large documents first
+    :param total_workers: number of workers
+    :param small_queue: queue of the small documents
+    :param large_queue: queue of the large documents
+    :return: the queues of each worker, in priority order
+    """
+    if total_workers <= 1:
+        return [[small_queue, large_queue]]
+    large_workers = max(1, total_workers // 4)
+    return [[small_queue]] * (total_workers - large_workers) + [[large_queue, small_queue]] * large_workers
+
+
+class WorkerSupervisor:
+    def __init__(self, worker_queues: List[List[str]], shutdown_timeout: float = 600,
+                 worker_args: Optional[List[str]] = None, min_uptime: float = 60,
+                 max_backoff: float = 300):
+        """
+        Start one worker process per entry, restart the workers that exit and stop them gracefully
+        :param worker_queues: the queues of each worker, in priority order
+        :param shutdown_timeout: time (seconds) given to the workers to finish their current job
+        :param worker_args: extra arguments of the worker script
+        :param min_uptime: a worker exiting before this time (seconds) is restarted with a growing delay
+        :param max_backoff: maximum delay (seconds) before restarting a worker
+        """
+        self.worker_queues = worker_queues
+        self.shutdown_timeout = shutdown_timeout
+        self.worker_args = worker_args or []
+        self.min_uptime = min_uptime
+        self.max_backoff = max_backoff
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.started_at: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def _start(self, index: int):
+        queues = ",".join(self.worker_queues[index])
+        # The workers run in their own session, so a Ctrl+C in the terminal only reaches the
+        # supervisor, which then sends a single SIGTERM (a second signal makes RQ force stop)
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, "--name", queues, *self.worker_args],
+            cwd=os.path.dirname(WORKER_SCRIPT),
+            start_new_session=True,
+        )
+        self.started_at[index] = time.time()
+        logger.info(f"Started worker {index} (pid {self.processes[index].pid}) on {queues}")
+
+    def _schedule_restart(self, index: int):
+        """
+        Restart a worker right away if it ran normally (e.g. --max-jobs), with an exponential
+        delay if it keeps exiting shortly after starting (e.g. a crash at startup)
+        """
+        process = self.processes[index]
+        if time.time() - self.started_at[index] >= self.min_uptime:
+            self.failures[index] = 0
+        else:
+            self.failures[index] = self.failures.get(index, 0) + 1
+        delay = min(self.max_backoff, 2 ** self.failures[index] - 1)
+        self.restart_at[index] = time.time() + delay
+        logger.warning(f"Worker {index} exited with code {process.returncode}, restarting in {delay:.0f}s")
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def stop(self):
+        """
+        Ask every worker to finish its current job, then kill the workers still running after the timeout
+        """
+        logger.info("Stopping the workers")
+        for process in self.processes.values():
+            if process.poll() is None:
+                # RQ workers finish their current job on SIGTERM (warm shut down)
+                process.send_signal(signal.SIGTERM)
+
+        deadline = time.time() + self.shutdown_timeout
+        for index, process in self.processes.items():
+            try:
+                process.wait(timeout=max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Killing worker {index} (pid {process.pid})")
+                process.kill()
+                process.wait()
+
+    def run(self, poll_interval: float = 1.0):
+        """
+        Start the workers and restart them when they exit (e.g. after --max-jobs), until SIGTERM or SIGINT
+        """
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for index in range(len(self.worker_queues)):
+            self._start(index)
+
+        while not self.stopping:
+            for index, process in list(self.processes.items()):
+                if self.stopping or process.poll() is None:
+                    continue
+                if index not in self.restart_at:
+                    self._schedule_restart(index)
+                if time.time() >= self.restart_at[index]:
+                    del self.restart_at[index]
+                    self._start(index)
+            time.sleep(poll_interval)
+
+        self.stop()
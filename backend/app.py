@@ -1,22 +1,43 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
 from functools import partial
 from urllib.parse import urlparse
 
 import uvicorn
-from configs.config import FRONTEND_SERVER_URL, BACKEND_SERVER_URL, engine_rag, engine_user
+from configs.config import (BACKEND_SERVER_URL, DEFAULT_TENANT,
+                            FRONTEND_SERVER_URL, engine_rag, engine_user)
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from model import RAGResponseWithUser, User
+from model import RAGResponseWithUser, UploadedFile, User
 from routers import router_list
-from routers.utils import create_db_and_tables
+from routers.http_client import close_ai_client, open_ai_client
+from routers.utils import create_db_and_tables, migrate_table
 
 create_db_and_tables_user = partial(create_db_and_tables, User, engine_user)
 create_db_and_tables_rag = partial(
     create_db_and_tables, RAGResponseWithUser, engine_rag
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    create_db_and_tables_user()
+    create_db_and_tables_rag()
+    # The history entries saved before created_at existed are the oldest ones
+    migrate_table(RAGResponseWithUser, engine_rag, backfill={"created_at": datetime(1970, 1, 1)})
+    # The users and files created before the tenants existed belong to the default tenant
+    migrate_table(User, engine_user, backfill={"tenant_id": DEFAULT_TENANT})
+    migrate_table(UploadedFile, engine_rag, backfill={"tenant_id": DEFAULT_TENANT})
+
+    # One pooled client to the AI server for the lifetime of the app
+    await open_ai_client()
+    yield
+    await close_ai_client()
+
+
 app = FastAPI(
     title="ESG RAG API",
-    on_startup=[create_db_and_tables_user, create_db_and_tables_rag],
+    lifespan=lifespan,
 )
 
 origins = [
@@ -17,7 +17,14 @@ engine_user = create_engine(sqlite_url_user, connect_args={"check_same_thread":
 
 sqlite_file_name_rag = os.getenv("SQLITE_FILE_NAME_RAG", "rag_database.db")
 sqlite_url_rag = f"sqlite:///{sqlite_file_name_rag}"
-engine_rag = create_engine(sqlite_url_rag, connect_args={"check_same_thread": False})
+# Each request opens its own session, the connections are reused from the pool
+engine_rag = create_engine(
+    sqlite_url_rag,
+    connect_args={"check_same_thread": False},
+    pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+    pool_pre_ping=True,
+)
 
 # Utility Functions
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -30,3 +37,19 @@ ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@admin.com")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")
 
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+# Tenant of the admin and of the users created without one, its data keeps the original folders
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 200 * 1024 * 1024))
+
+# Pooled HTTP client used to call the AI server
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 120))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+
+# Number of history entries returned per page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 20))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 100))
@@ -1,2 +1,2 @@
-from .ai import RAGResponseWithUser, RAGQuery, RAGResponse, ConvertPath, ConvertResponse
+from .ai import RAGResponseWithUser, RAGHistoryItem, RAGHistoryPage, RAGQuery, RAGResponse, ConvertPath, ConvertResponse, JobIds, UploadedFile
 from .user import User
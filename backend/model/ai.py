@@ -1,10 +1,18 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
 from pydantic import BaseModel
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from uuid import uuid4
+from configs.config import DEFAULT_TENANT
 
 class RAGQuery(BaseModel):
     text: str
     model: str
+    # Optional scope of the retrieval: document names and chunk metadata filters
+    documents: Optional[List[str]] = None
+    filters: Optional[Dict[str, Any]] = None
 
 
 class RAGResponse(BaseModel):
@@ -15,6 +23,9 @@ class RAGResponse(BaseModel):
     keyword_metadata: str
 
 class RAGResponseWithUser(SQLModel, table=True):
+    # The history of a user is read newest first
+    __table_args__ = (Index("ix_ragresponsewithuser_user_id_created_at", "user_id", "created_at"),)
+
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
     query: str
     answer: str
@@ -23,6 +34,20 @@ class RAGResponseWithUser(SQLModel, table=True):
     keyword_context: str
     keyword_metadata: str
     user_id: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+
+class RAGHistoryItem(BaseModel):
+    id: str
+    query: str
+    answer: str
+    user_id: str
+    created_at: datetime
+
+
+class RAGHistoryPage(BaseModel):
+    items: List[RAGHistoryItem]
+    next_cursor: Optional[str] = None
 
 class ConvertPath(BaseModel):
     name: str
@@ -30,3 +55,19 @@ class ConvertPath(BaseModel):
 
 class ConvertResponse(BaseModel):
     job_id: str
+    # "done" or "failed"
+    status: str = "done"
+
+
+class JobIds(BaseModel):
+    job_ids: List[str]
+
+
+class UploadedFile(SQLModel, table=True):
+    # Hash of the file, seeded with the tenant for the non-default tenants
+    sha256: str = Field(primary_key=True)
+    filename: str = Field(index=True)
+    size: int
+    tenant_id: str = Field(default=DEFAULT_TENANT, index=True)
+    # The conversion job of the file
+    job_id: Optional[str] = Field(default=None, index=True)
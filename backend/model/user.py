@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field
 from uuid import uuid4
+from configs.config import DEFAULT_TENANT
 
 
 class User(SQLModel, table=True):
@@ -7,4 +8,6 @@ class User(SQLModel, table=True):
     email: str = Field(index=True)
     password: str
     name: str
-    role: str
\ No newline at end of file
+    role: str
+    # The user only sees the documents of their tenant
+    tenant_id: str = Field(default=DEFAULT_TENANT, index=True)
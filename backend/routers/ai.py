@@ -1,24 +1,58 @@
+import base64
+import json
+from datetime import datetime
+from functools import partial
+from typing import Optional
+
 import httpx
-from configs.config import AI_SERVER_URL, engine_rag
-from fastapi import APIRouter, Header, HTTPException
-from model.ai import RAGQuery, RAGResponse, RAGResponseWithUser
+from configs.config import HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, engine_rag
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from model.ai import (RAGHistoryItem, RAGHistoryPage, RAGQuery, RAGResponse,
+                      RAGResponseWithUser)
+from sqlmodel import Session, and_, or_, select
 
-from .utils import get_session, validate_jwt
+from .http_client import get_ai_client
+from .utils import (get_session, iter_session, tenant_headers, validate_jwt,
+                    validate_jwt_tenant)
 
 router = APIRouter()
 
-session_rag = get_session(engine_rag)
+get_session_rag = partial(iter_session, engine_rag)
+
+
+def encode_cursor(created_at: datetime, entry_id: str) -> str:
+    """
+    Encode the position of the last entry of a page
+    """
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), entry_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor into the creation time and the id of the last entry of the previous page
+    """
+    try:
+        created_at, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), entry_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.post("/api/query", response_model=RAGResponse)
-async def query_rag(query: RAGQuery, authorization: str = Header(None)):
+async def query_rag(
+        query: RAGQuery,
+        authorization: str = Header(None),
+        x_tenant_id: Optional[str] = Header(None),
+        session: Session = Depends(get_session_rag),
+):
     try:
         # Validate JWT token
-        user_id = validate_jwt(authorization)
+        user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
 
-        # Call the RAG service
-        response = await httpx.AsyncClient().post(
-            AI_SERVER_URL + "/query", json={"text": query.text, "model": query.model}
+        # Call the RAG service on the documents of the tenant
+        response = await get_ai_client().post(
+            "/query", json=query.model_dump(exclude_none=True), headers=tenant_headers(tenant_id)
         )
         answer = response.json()
         answer_with_user = answer.copy()
@@ -26,8 +60,8 @@ async def query_rag(query: RAGQuery, authorization: str = Header(None)):
         answer_with_user["query"] = query.text
         answer_with_user = RAGResponseWithUser(**answer_with_user)
 
-        session_rag.add(answer_with_user)
-        session_rag.commit()
+        session.add(answer_with_user)
+        session.commit()
 
         return RAGResponse(**answer)
     except Exception as e:
@@ -35,10 +69,107 @@ async def query_rag(query: RAGQuery, authorization: str = Header(None)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/api/history", response_model=list[RAGResponseWithUser])
-async def get_rag_history():
+@router.post("/api/query_stream")
+async def query_rag_stream(
+        query: RAGQuery,
+        authorization: str = Header(None),
+        x_tenant_id: Optional[str] = Header(None),
+):
+    # Validate JWT token
+    user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
+
+    async def relay():
+        answer = {"answer": ""}
+        completed = False
+
+        # Relay every event to the client while collecting the full answer
+        async with get_ai_client().stream(
+            "POST",
+            "/query_stream",
+            json=query.model_dump(exclude_none=True),
+            headers=tenant_headers(tenant_id),
+            timeout=httpx.Timeout(None),
+        ) as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "context":
+                    answer.update({key: value for key, value in event.items() if key != "type"})
+                elif event["type"] == "token":
+                    answer["answer"] += event["content"]
+                elif event["type"] == "done":
+                    completed = True
+                yield line + "\n"
+
+        # Persist the answer once the stream completes
+        if completed:
+            answer_with_user = RAGResponseWithUser(**answer, user_id=user_id, query=query.text)
+            with get_session(engine_rag) as session:
+                session.add(answer_with_user)
+                session.commit()
+
+    return StreamingResponse(relay(), media_type="application/x-ndjson")
+
+
+@router.get("/api/history", response_model=RAGHistoryPage)
+async def get_rag_history(
+        limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        user_id: Optional[str] = None,
+        authorization: str = Header(None),
+        session: Session = Depends(get_session_rag),
+):
+    """
+    Get a page of the history, newest first, without the retrieved contexts.
+    Users only see their own history, the admin sees every user or the one given by user_id
+    """
+    current_user_id = validate_jwt(authorization)
+    if current_user_id != "admin":
+        user_id = current_user_id
+
     try:
-        history = session_rag.query(RAGResponseWithUser).all()
-        return history
+        statement = select(
+            RAGResponseWithUser.id,
+            RAGResponseWithUser.query,
+            RAGResponseWithUser.answer,
+            RAGResponseWithUser.user_id,
+            RAGResponseWithUser.created_at,
+        )
+        if user_id is not None:
+            statement = statement.where(RAGResponseWithUser.user_id == user_id)
+        if cursor is not None:
+            # Keyset pagination, continue after the last entry of the previous page
+            created_at, entry_id = decode_cursor(cursor)
+            statement = statement.where(or_(
+                RAGResponseWithUser.created_at < created_at,
+                and_(RAGResponseWithUser.created_at == created_at, RAGResponseWithUser.id < entry_id),
+            ))
+        statement = statement.order_by(
+            RAGResponseWithUser.created_at.desc(), RAGResponseWithUser.id.desc()
+        ).limit(limit + 1)
+
+        rows = session.exec(statement).all()
+        items = [RAGHistoryItem(**row._mapping) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+        return RAGHistoryPage(items=items, next_cursor=next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/history/{entry_id}", response_model=RAGResponseWithUser)
+async def get_rag_history_entry(
+        entry_id: str,
+        authorization: str = Header(None),
+        session: Session = Depends(get_session_rag),
+):
+    """
+    Get a history entry with its retrieved contexts
+    """
+    current_user_id = validate_jwt(authorization)
+    entry = session.get(RAGResponseWithUser, entry_id)
+    if entry is None or (current_user_id != "admin" and entry.user_id != current_user_id):
+        raise HTTPException(status_code=404, detail="History entry not found")
+    return entry
@@ -0,0 +1,56 @@
+from typing import Optional
+
+import httpx
+from configs.config import (AI_SERVER_URL, HTTP_CONNECT_TIMEOUT,
+                            HTTP_MAX_CONNECTIONS,
+                            HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_RETRIES,
+                            HTTP_TIMEOUT)
+
+# Client shared by every request for the lifetime of the app, created in the lifespan
+ai_client: Optional[httpx.AsyncClient] = None
+
+
+def is_http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_ai_client() -> httpx.AsyncClient:
+    """
+    Create the pooled client used to call the AI server, with keep-alive, timeouts and
+    retries of failed connections. HTTP/2 is used when the h2 package is installed
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=is_http2_available(),
+        retries=HTTP_RETRIES,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url=AI_SERVER_URL,
+        transport=transport,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def open_ai_client():
+    global ai_client
+    ai_client = create_ai_client()
+
+
+async def close_ai_client():
+    global ai_client
+    if ai_client is not None:
+        await ai_client.aclose()
+        ai_client = None
+
+
+def get_ai_client() -> httpx.AsyncClient:
+    if ai_client is None:
+        raise RuntimeError("The AI server client is not open")
+    return ai_client
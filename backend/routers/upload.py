@@ -1,31 +1,96 @@
+import hashlib
 import os
+import uuid
+from typing import Optional
 
-import httpx
-from configs.config import AI_SERVER_URL, UPLOAD_DIR
+from configs.config import (DEFAULT_TENANT, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE,
+                            UPLOAD_DIR, engine_rag)
 from fastapi import APIRouter, File, Header, HTTPException, UploadFile
-from model.ai import ConvertResponse
-from routers.utils import validate_jwt
+from model.ai import ConvertResponse, JobIds, UploadedFile
+from routers.http_client import get_ai_client
+from routers.utils import (get_session, get_tenant_folder, tenant_headers,
+                           validate_jwt, validate_jwt_tenant)
+from starlette.concurrency import run_in_threadpool
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 router = APIRouter()
 
 
+async def save_upload(file: UploadFile, file_path: str, tenant_id: str = DEFAULT_TENANT):
+    """
+    Stream the uploaded file to disk in fixed-size chunks, hashing it on the way
+    :param file: the uploaded file
+    :param file_path: where to save the file
+    :param tenant_id: the tenant of the file, the same file can be uploaded once per tenant
+    :return: the sha256 hash and the size of the file
+    """
+    sha256 = hashlib.sha256()
+    if tenant_id != DEFAULT_TENANT:
+        sha256.update(f"{tenant_id}\0".encode())
+    size = 0
+    with open(file_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail="File is too large")
+            sha256.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+    return sha256.hexdigest(), size
+
+
 @router.post("/api/upload")
-async def upload_pdf(file: UploadFile = File(...), authorization: str = Header(None)):
+async def upload_pdf(
+        file: UploadFile = File(...),
+        authorization: str = Header(None),
+        x_tenant_id: Optional[str] = Header(None),
+):
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
     try:
-        user_id = validate_jwt(authorization)
+        user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
         if user_id != "admin":
             raise HTTPException(status_code=403, detail="Forbidden")
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        response = httpx.post(AI_SERVER_URL + "/convert", json={"name": file.filename})
-        return {"message": "Successfully uploaded"}
+        upload_folder = get_tenant_folder(UPLOAD_DIR, tenant_id)
+        os.makedirs(upload_folder, exist_ok=True)
+        file_path = os.path.join(upload_folder, file.filename)
+
+        # Write to a temporary file first, so a rejected upload never replaces a file
+        temp_path = os.path.join(upload_folder, f".{uuid.uuid4()}.part")
+        try:
+            sha256, size = await save_upload(file, temp_path, tenant_id)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        # Skip the conversion of a file that has already been uploaded
+        with get_session(engine_rag) as session:
+            uploaded_file = session.get(UploadedFile, sha256)
+        if uploaded_file is not None:
+            os.remove(temp_path)
+            return {"message": f"Already uploaded as {uploaded_file.filename}"}
+
+        os.replace(temp_path, file_path)
+        try:
+            response = await get_ai_client().post(
+                "/convert", json={"name": file.filename}, headers=tenant_headers(tenant_id)
+            )
+            response.raise_for_status()
+            job_id = response.json()["message"]
+        except Exception:
+            os.remove(file_path)
+            raise
+
+        # The file is only recorded once its conversion is queued, and forgotten if the conversion fails
+        with get_session(engine_rag) as session:
+            session.merge(UploadedFile(
+                sha256=sha256, filename=file.filename, size=size, tenant_id=tenant_id, job_id=job_id
+            ))
+            session.commit()
+        return {"message": "Successfully uploaded", "job_id": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -33,29 +98,67 @@ async def upload_pdf(file: UploadFile = File(...), authorization: str = Header(N
 
 @router.post("/api/response_convert")
 async def response_convert(convert_response: ConvertResponse):
+    if convert_response.status == "failed":
+        # Allow the file to be uploaded again
+        with get_session(engine_rag) as session:
+            for uploaded_file in session.query(UploadedFile).filter(
+                    UploadedFile.job_id == convert_response.job_id
+            ).all():
+                session.delete(uploaded_file)
+            session.commit()
     return {"message": convert_response.job_id}
 
 
-@router.get("/api/get_uploaded_documents")
-async def get_documents(authorization: str = Header(None)):
+@router.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str, authorization: str = Header(None)):
     try:
         user_id = validate_jwt(authorization)
         if user_id != "admin":
             raise HTTPException(status_code=403, detail="Forbidden")
-        response = httpx.get(AI_SERVER_URL + "/get_uploaded_documents")
+        response = await get_ai_client().get(f"/jobs/{job_id}")
         return response.json()
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/api/get_rag_documents")
-async def get_rag_documents(authorization: str = Header(None)):
+@router.post("/api/jobs/status")
+async def get_job_statuses(job_ids: JobIds, authorization: str = Header(None)):
     try:
         user_id = validate_jwt(authorization)
         if user_id != "admin":
             raise HTTPException(status_code=403, detail="Forbidden")
-        response = httpx.get(AI_SERVER_URL + "/get_rag_documents")
+        response = await get_ai_client().post("/jobs/status", json={"job_ids": job_ids.job_ids})
+        return response.json()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/get_uploaded_documents")
+async def get_documents(authorization: str = Header(None), x_tenant_id: Optional[str] = Header(None)):
+    try:
+        user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
+        if user_id != "admin":
+            raise HTTPException(status_code=403, detail="Forbidden")
+        response = await get_ai_client().get("/get_uploaded_documents", headers=tenant_headers(tenant_id))
+        return response.json()
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/get_rag_documents")
+async def get_rag_documents(authorization: str = Header(None), x_tenant_id: Optional[str] = Header(None)):
+    try:
+        user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
+        if user_id != "admin":
+            raise HTTPException(status_code=403, detail="Forbidden")
+        response = await get_ai_client().get("/get_rag_documents", headers=tenant_headers(tenant_id))
         return response.json()
     except Exception as e:
         print(e)
@@ -63,12 +166,20 @@ async def get_rag_documents(authorization: str = Header(None)):
 
 
 @router.delete("/api/delete_document/{name}")
-async def delete_document(name: str, authorization: str = Header(None)):
+async def delete_document(name: str, authorization: str = Header(None), x_tenant_id: Optional[str] = Header(None)):
     try:
-        user_id = validate_jwt(authorization)
+        user_id, tenant_id = validate_jwt_tenant(authorization, x_tenant_id)
         if user_id != "admin":
             raise HTTPException(status_code=403, detail="Forbidden")
-        httpx.delete(AI_SERVER_URL + f"/delete_document/{name}")
+        await get_ai_client().delete(f"/delete_document/{name}", headers=tenant_headers(tenant_id))
+
+        # Allow the same file to be uploaded again in the tenant
+        with get_session(engine_rag) as session:
+            for uploaded_file in session.query(UploadedFile).filter(
+                    UploadedFile.filename == f"{name}.pdf", UploadedFile.tenant_id == tenant_id
+            ).all():
+                session.delete(uploaded_file)
+            session.commit()
         return {"message": "Document deleted"}
     except Exception as e:
         print(e)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Response, status
 from fastapi import Depends, HTTPException, status, Header, Body, Path
 from sqlmodel import Session
-from .utils import validate_jwt, get_password_hash, get_session
+from .utils import validate_jwt, validate_tenant_id, get_password_hash, get_session
 from model.user import User
 from configs.config import engine_user
 from functools import partial
@@ -16,7 +16,13 @@ get_session_user = partial(get_session, engine_user)
 def create_user(
         user: User,
         session: Session = Depends(get_session_user),
+        authorization: str = Header(None),
 ):
+    # Only the admin can create a user in another tenant than the default one
+    if "tenant_id" in user.model_fields_set:
+        if validate_jwt(authorization) != "admin":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+        validate_tenant_id(user.tenant_id)
     user.password = get_password_hash(user.password)
     session.add(user)
     session.commit()
@@ -45,7 +51,7 @@ def update_user(
         user: User = Body(...),
         authorization: str = Header(None),
 ):
-    validate_jwt(authorization)
+    current_user_id = validate_jwt(authorization)
     existing_user = session.get(User, id)
     if not existing_user:
         raise HTTPException(
@@ -55,6 +61,11 @@ def update_user(
     existing_user.email = user.email or existing_user.email
     existing_user.name = user.name or existing_user.name
     existing_user.role = user.role or existing_user.role
+    # Only the admin can move a user to another tenant
+    if "tenant_id" in user.model_fields_set and user.tenant_id != existing_user.tenant_id:
+        if current_user_id != "admin":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+        existing_user.tenant_id = validate_tenant_id(user.tenant_id)
     if user.password:
         existing_user.password = get_password_hash(user.password)
     session.add(existing_user)
@@ -1,6 +1,9 @@
 import jwt
-from typing import Optional
+import os
+import re
+from typing import Optional, Tuple
 from fastapi import HTTPException, status
+from sqlalchemy import inspect
 from sqlmodel import Session, SQLModel
 from datetime import datetime, timedelta, timezone
 from configs.config import (
@@ -8,7 +11,13 @@ from configs.config import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     SECRET_KEY,
     ALGORITHM,
+    DEFAULT_TENANT,
+    engine_user,
 )
+from model.user import User
+
+# Tenant ids are used in file paths and in the collection names of the AI server
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
 
 
 def create_db_and_tables(model, engine, create_new=False):
@@ -18,10 +27,40 @@ def create_db_and_tables(model, engine, create_new=False):
     model.metadata.create_all(engine)
 
 
+def migrate_table(model, engine, backfill: Optional[dict] = None):
+    """
+    Add the columns and indexes of the model that are missing from an existing table,
+    since create_all only creates the tables that do not exist
+    :param backfill: value of each added column for the existing rows
+    """
+    table = model.__table__
+    existing_columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            if backfill and column.name in backfill:
+                connection.execute(
+                    table.update().where(column.is_(None)).values({column.name: backfill[column.name]})
+                )
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+
 def get_session(engine):
     return Session(engine)
 
 
+def iter_session(engine):
+    """
+    Dependency giving each request its own session, closed at the end of the request
+    """
+    with Session(engine) as session:
+        yield session
+
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -41,14 +80,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def validate_jwt(token: str):
+def decode_jwt(token: str) -> dict:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing"
         )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
@@ -57,3 +95,56 @@ def validate_jwt(token: str):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
+
+
+def validate_jwt(token: str):
+    return decode_jwt(token).get("sub")
+
+
+def validate_jwt_tenant(token: str, tenant_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Get the user and the tenant of a token. The tenant is the one of the user,
+    only the admin can choose another one with the X-Tenant-Id header
+    :param token: the JWT token
+    :param tenant_id: the tenant asked by the request
+    :return: the user id and the tenant id
+    """
+    user_id = validate_jwt(token)
+    user_tenant_id = get_user_tenant(user_id)
+    if tenant_id is None or tenant_id == user_tenant_id:
+        return user_id, user_tenant_id
+    if user_id != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return user_id, validate_tenant_id(tenant_id)
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    if not TENANT_ID_PATTERN.match(tenant_id or ""):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid tenant {tenant_id}")
+    return tenant_id
+
+
+def get_user_tenant(user_id: str) -> str:
+    """
+    Get the current tenant of a user from the database, so moving a user to another
+    tenant takes effect without waiting for their token to expire
+    """
+    if user_id == "admin":
+        return DEFAULT_TENANT
+    with Session(engine_user) as session:
+        user = session.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    return user.tenant_id
+
+
+def tenant_headers(tenant_id: str) -> dict:
+    # The AI server routes the request to the collection and indexes of the tenant
+    return {"X-Tenant-Id": tenant_id}
+
+
+def get_tenant_folder(folder: str, tenant_id: str) -> str:
+    # Same layout as the AI server, the default tenant keeps the folder itself
+    if tenant_id == DEFAULT_TENANT:
+        return folder
+    return os.path.join(folder, "tenants", tenant_id)